@@ -5,9 +5,17 @@ import os
 import pygame.mixer
 
 import math
+import multiprocessing
 import random
-import copy
+import sys
+import threading
 import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError: # Optional, the evaluation falls back to plain Python
+    np = None
 
 # cach escape positions
 
@@ -34,6 +42,86 @@ MOBILITY_WEIGHT = 0.05   # Mobility weight
 KING_SAFETY_WEIGHT = 0.15 # King safety weight
 CONNECTED_DEFENDERS_WEIGHT = 0.05 # Bonus for connected Advisors/Elephants
 
+# --- Mobility Modes ---
+# How _get_piece_mobility counts a piece's moves:
+#   'exact'  - legal moves (checks, pins and the flying general all respected)
+#   'pinned' - pseudo-legal counts, made exact only for the general and pinned pieces
+#   'pseudo' - pseudo-legal counts straight from the move tables
+MOBILITY_MODES = ('exact', 'pinned', 'pseudo')
+ROLLOUT_MOBILITY = 'pseudo' # Used by the evaluation at the end of an MCTS rollout
+
+# --- Alpha-Beta Search ---
+MATE_SCORE = 100000          # Score for mate at the root, minus the ply it happens at
+ALPHA_BETA_MAX_DEPTH = 32    # Iterative deepening and check extension cap
+ASPIRATION_WINDOW = 50       # Half-width of the first window around the previous score
+ALPHA_BETA_SOFT_TIME = 0.5   # Fraction of time_limit after which no new iteration starts
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2 # Transposition table bound flags
+TRANSPOSITION_TABLE_MB = 16  # Default budget of the alpha-beta table
+MATE_TABLE_MB = 8            # Default budget of the mate search table
+KILLER_SLOTS = 2             # Killer moves kept per ply
+HISTORY_LIMIT = 1 << 24      # History scores are halved once one reaches this
+
+# --- Quiescence Search ---
+QUIESCENCE_MAX_PLY = 8       # Deeper than this the static score is returned as is
+QUIESCENCE_CHECK_PLIES = 1   # Plies at the start of quiescence that also try checking moves
+QUIESCENCE_DELTA = 200       # Skip captures that can't lift the score to alpha even with this margin
+# How MCTS.simulate scores a new node:
+#   'playout'    - up to 50 capture/check-biased random moves, then the evaluation
+#   'quiescence' - the evaluation after a quiescence search from the node
+#   'random'     - up to 50 random moves, drawn from the pseudo-legal moves with
+#                  only the drawn move tested for legality, then the evaluation
+#   'capture'    - as 'random', but captures are drawn before quiet moves
+#   'truncated'  - as 'random', stopping after ROLLOUT_TRUNCATE_PLIES moves
+ROLLOUT_POLICIES = ('playout', 'quiescence', 'random', 'capture', 'truncated')
+ROLLOUT_POLICY = 'playout'
+ROLLOUT_MAX_PLIES = 50
+ROLLOUT_TRUNCATE_PLIES = 8
+
+# --- MCTS Selection ---
+# How MCTS.select_node picks a child and expand_node picks the move to add:
+#   'uct'  - (default) UCT plus a bonus for AI moves towards the enemy general; the AI
+#            expands the move ending nearest that general, the opponent a random one
+#   'puct' - PUCT over per-edge priors computed once per node, with children
+#            admitted in prior order by progressive widening
+SELECTION_POLICIES = ('uct', 'puct')
+SELECTION_POLICY = 'uct'
+PUCT_EXPLORATION = 1.5       # Weight of prior * sqrt(parent visits) / (1 + child visits)
+WIDENING_CONSTANT = 2.0      # A node may have WIDENING_CONSTANT * (visits + 1) ** WIDENING_EXPONENT children
+WIDENING_EXPONENT = 0.5
+# Prior features, in centipawns, softmaxed with PRIOR_TEMPERATURE: captured piece value,
+# PST gain of the moved piece, and bonuses for giving check, for each step towards the
+# enemy general and for history / countermove standing
+PRIOR_CHECK_BONUS = 300
+PRIOR_KING_STEP_BONUS = 20
+PRIOR_HISTORY_BONUS = 100    # For the move with the most history (see MoveOrdering), and for the countermove
+PRIOR_TEMPERATURE = 200.0
+
+# RAVE: with MCTS.rave on, selection blends each edge's value with its
+# all-moves-as-first (AMAF) value, the mean result of simulations in which the
+# side to move played that move at any later point. The AMAF weight is
+# sqrt(RAVE_EQUIVALENCE / (3 * visits + RAVE_EQUIVALENCE)), fading as visits grow.
+USE_RAVE = False
+RAVE_EQUIVALENCE = 1000
+
+# --- Proof-Number Mate Search ---
+PN_INFINITY = 1 << 30        # Proof/disproof number of a solved node
+PN_NODE_BUDGET = 20000       # Node expansions per proof-number search
+PN_TABLE_MB = 32             # Memory cap of the proof-number table
+PN_TABLE_ENTRY_BYTES = 160   # Rough size of one table entry, hash key included
+
+# --- Parallel MCTS ---
+# With more than one worker, MCTS runs root-parallel: each worker process
+# searches its own tree from the root with its own seed and the root-child
+# statistics are summed at the end. 1 keeps the search in this process.
+MCTS_WORKERS = 1
+# With more than one thread, MCTS runs tree-parallel: the threads share one
+# tree, each adding VIRTUAL_LOSS lost visits to the edges it is searching below
+# and updating statistics under one of LOCK_STRIPES locks picked by node hash.
+# It only scales on a free-threaded build; under the GIL the threads take turns.
+MCTS_THREADS = 1
+VIRTUAL_LOSS = 1
+LOCK_STRIPES = 64
+
 # --- Piece Square Tables (PSTs) ---
 # Values represent bonuses/penalties for a piece being on that square.
 # Indexed by [row][col]. Needs careful flipping logic.
@@ -159,18 +247,278 @@ PST = {
     '兵': PAWN_PST         # Will be flipped
 }
 
+# --- Move Generation Tables ---
+# Candidate targets for every piece type, built once at import time so move
+# generation only visits squares a piece can actually reach.
+# Palace/river dependent tables are keyed by (color_char, flipped).
+# All target lists are sorted row-major, matching the old 90-square scan order.
+
+SQUARES = [[(r, c) for c in range(9)] for r in range(10)] # Shared position tuples
+
+def _is_bottom_side(color_char, flipped):
+    """ Red starts at the bottom (rows 7-9) unless the board is flipped """
+    return (color_char == 'R') != flipped
+
+def _in_own_palace(color_char, flipped, r, c):
+    if not 3 <= c <= 5:
+        return False
+    if _is_bottom_side(color_char, flipped):
+        return 7 <= r <= 9
+    return 0 <= r <= 2
+
+def _on_own_side(color_char, flipped, r):
+    if _is_bottom_side(color_char, flipped):
+        return r > 4
+    return r < 5
+
+def _build_move_tables():
+    """ Precompute per-square target tables for all piece types """
+    def on_board(r, c):
+        return 0 <= r < 10 and 0 <= c < 9
+
+    general_targets, advisor_targets, elephant_targets, pawn_targets = {}, {}, {}, {}
+    for color_char in 'RB':
+        for flipped in (False, True):
+            key = (color_char, flipped)
+            bottom = _is_bottom_side(color_char, flipped)
+            forward = -1 if bottom else 1
+            general_rows, advisor_rows, elephant_rows, pawn_rows = [], [], [], []
+            for r in range(10):
+                general_row, advisor_row, elephant_row, pawn_row = [], [], [], []
+                for c in range(9):
+                    general_row.append(tuple(sorted(
+                        SQUARES[r + dr][c + dc]
+                        for dr, dc in ((-1, 0), (0, -1), (0, 1), (1, 0))
+                        if on_board(r + dr, c + dc) and _in_own_palace(color_char, flipped, r + dr, c + dc))))
+                    advisor_row.append(tuple(sorted(
+                        SQUARES[r + dr][c + dc]
+                        for dr, dc in ((-1, -1), (-1, 1), (1, -1), (1, 1))
+                        if on_board(r + dr, c + dc) and _in_own_palace(color_char, flipped, r + dr, c + dc))))
+                    # (target, elephant eye)
+                    elephant_row.append(tuple(sorted(
+                        (SQUARES[r + 2 * dr][c + 2 * dc], SQUARES[r + dr][c + dc])
+                        for dr, dc in ((-1, -1), (-1, 1), (1, -1), (1, 1))
+                        if on_board(r + 2 * dr, c + 2 * dc) and _on_own_side(color_char, flipped, r + 2 * dr))))
+                    # Pawns may step sideways once they have crossed the river
+                    steps = [(forward, 0)]
+                    if not _on_own_side(color_char, flipped, r):
+                        steps += [(0, -1), (0, 1)]
+                    pawn_row.append(tuple(sorted(
+                        SQUARES[r + dr][c + dc] for dr, dc in steps if on_board(r + dr, c + dc))))
+                general_rows.append(general_row)
+                advisor_rows.append(advisor_row)
+                elephant_rows.append(elephant_row)
+                pawn_rows.append(pawn_row)
+            general_targets[key] = general_rows
+            advisor_targets[key] = advisor_rows
+            elephant_targets[key] = elephant_rows
+            pawn_targets[key] = pawn_rows
+
+    horse_targets, rays = [], []
+    for r in range(10):
+        horse_row, ray_row = [], []
+        for c in range(9):
+            # (target, horse leg)
+            horse_row.append(tuple(sorted(
+                (SQUARES[r + dr][c + dc], SQUARES[r + (dr // 2 if abs(dr) == 2 else 0)][c + (dc // 2 if abs(dc) == 2 else 0)])
+                for dr, dc in ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+                if on_board(r + dr, c + dc))))
+            # Rays walk outward from the square: up, left, right, down
+            ray_row.append((
+                tuple(SQUARES[rr][c] for rr in range(r - 1, -1, -1)),
+                tuple(SQUARES[r][cc] for cc in range(c - 1, -1, -1)),
+                tuple(SQUARES[r][cc] for cc in range(c + 1, 9)),
+                tuple(SQUARES[rr][c] for rr in range(r + 1, 10)),
+            ))
+        horse_targets.append(horse_row)
+        rays.append(ray_row)
+
+    return general_targets, advisor_targets, elephant_targets, pawn_targets, horse_targets, rays
+
+GENERAL_TARGETS, ADVISOR_TARGETS, ELEPHANT_TARGETS, PAWN_TARGETS, HORSE_TARGETS, RAYS = _build_move_tables()
+
+def _invert_targets(table):
+    """
+    Reverse a per-square target table: for every square, the origins that
+    can reach it. Entries of the form (target, block_square) keep their
+    block square (horse leg / elephant eye, which stays relative to the origin).
+    """
+    inverse = [[[] for _ in range(9)] for _ in range(10)]
+    for r in range(10):
+        for c in range(9):
+            for entry in table[r][c]:
+                if isinstance(entry[0], tuple):
+                    (to_r, to_c), block = entry
+                    inverse[to_r][to_c].append((SQUARES[r][c], block))
+                else:
+                    inverse[entry[0]][entry[1]].append(SQUARES[r][c])
+    return [[tuple(cell) for cell in row] for row in inverse]
+
+# Reverse attack tables used by ChessValidator.is_square_attacked
+GENERAL_ATTACKERS = {key: _invert_targets(table) for key, table in GENERAL_TARGETS.items()}
+ADVISOR_ATTACKERS = {key: _invert_targets(table) for key, table in ADVISOR_TARGETS.items()}
+ELEPHANT_ATTACKERS = {key: _invert_targets(table) for key, table in ELEPHANT_TARGETS.items()}
+PAWN_ATTACKERS = {key: _invert_targets(table) for key, table in PAWN_TARGETS.items()}
+HORSE_ATTACKERS = _invert_targets(HORSE_TARGETS)
+
+# --- Zobrist Keys ---
+# One flat table per process, generated from a fixed seed so hashes are
+# reproducible across runs and worker processes.
+# Key for piece p on (r, c) is ZOBRIST_KEYS[ZOBRIST_PIECE_BASE[p] + r * 9 + c].
+ZOBRIST_SEED = 20240731
+ZOBRIST_PIECES = ['R帥', 'R仕', 'R相', 'R馬', 'R車', 'R炮', 'R兵',
+                  'B將', 'B士', 'B象', 'B馬', 'B車', 'B炮', 'B卒']
+ZOBRIST_PIECE_BASE = {piece: i * 90 for i, piece in enumerate(ZOBRIST_PIECES)}
+_zobrist_rng = random.Random(ZOBRIST_SEED)
+ZOBRIST_KEYS = [_zobrist_rng.getrandbits(64) for _ in range(len(ZOBRIST_PIECES) * 90)]
+ZOBRIST_SIDE = {'red': _zobrist_rng.getrandbits(64), 'black': _zobrist_rng.getrandbits(64)}
+del _zobrist_rng
+
+def compute_zobrist_hash(board, color):
+    """ Full Zobrist hash of a board, used to seed incremental updates """
+    h = 0
+    for row in range(10):
+        board_row = board[row]
+        for col in range(9):
+            piece = board_row[col]
+            if piece:
+                h ^= ZOBRIST_KEYS[ZOBRIST_PIECE_BASE[piece] + row * 9 + col]
+    return h ^ ZOBRIST_SIDE[color]
+
+# --- Compact Board Encoding ---
+# A board packs into 90 bytes (index r * 9 + c, same as the Zobrist squares).
+# Piece codes: low 3 bits are the piece type, BLACK_BIT marks Black, 0 is empty.
+BLACK_BIT = 8
+PIECE_CODES = {'R帥': 1, 'R仕': 2, 'R相': 3, 'R馬': 4, 'R車': 5, 'R炮': 6, 'R兵': 7,
+               'B將': 9, 'B士': 10, 'B象': 11, 'B馬': 12, 'B車': 13, 'B炮': 14, 'B卒': 15}
+CODE_PIECES = [None] * 16 # Code -> piece string, None for empty
+for _piece, _code in PIECE_CODES.items():
+    CODE_PIECES[_code] = _piece
+del _piece, _code
+
+def encode_board(board):
+    """ Pack a list-of-lists board into a 90-entry bytearray """
+    return bytearray([PIECE_CODES[piece] if piece else 0 for row in board for piece in row])
+
+def decode_board(squares):
+    """ Unpack 90 piece codes into the list-of-lists board used by the GUI and validators """
+    pieces = [CODE_PIECES[code] for code in squares]
+    return [pieces[r * 9:r * 9 + 9] for r in range(10)]
+
+# --- Bitboard Tables ---
+# Bit r * 9 + c of a Python int stands for square (r, c), so ascending bits are
+# row-major order. Sliders use the 9-bit occupancy of their rank and the 10-bit
+# occupancy of their file (bit = row) to look up ray attacks.
+SQUARE_LIST = [SQUARES[r][c] for r in range(10) for c in range(9)] # Bit index -> position tuple
+
+# A move packs into 14 bits as from square << 7 | to square (square = r * 9 + c), 0 for no move
+def pack_move(move):
+    if not move:
+        return 0
+    (from_row, from_col), (to_row, to_col) = move
+    return (from_row * 9 + from_col) << 7 | (to_row * 9 + to_col)
+
+def unpack_move(code):
+    return (SQUARE_LIST[code >> 7], SQUARE_LIST[code & 0x7F]) if code else None
+
+# A (red, black) pair of general squares packs the same way, with NO_SQUARE for a captured general
+NO_SQUARE = 0x7F
+
+def _pack_kings(kings):
+    red, black = (king[0] * 9 + king[1] if king else NO_SQUARE for king in kings)
+    return red << 7 | black
+
+def _unpack_kings(code):
+    red, black = code >> 7, code & 0x7F
+    return (SQUARE_LIST[red] if red != NO_SQUARE else None, SQUARE_LIST[black] if black != NO_SQUARE else None)
+
+def _slide_masks(length):
+    """
+    For a line of length squares: slide[i][occ] is every square a slider on i
+    reaches up to and including the first blocker each way; jump[i][occ] is the
+    second blocker each way (what a cannon captures over a screen).
+    """
+    slide = [[0] * (1 << length) for _ in range(length)]
+    jump = [[0] * (1 << length) for _ in range(length)]
+    for i in range(length):
+        for occ in range(1 << length):
+            slide_mask = jump_mask = 0
+            for step in (-1, 1):
+                j = i + step
+                screened = False
+                while 0 <= j < length:
+                    if not screened:
+                        slide_mask |= 1 << j
+                        if occ >> j & 1:
+                            screened = True
+                    elif occ >> j & 1:
+                        jump_mask |= 1 << j
+                        break
+                    j += step
+            slide[i][occ] = slide_mask
+            jump[i][occ] = jump_mask
+    return slide, jump
+
+RANK_SLIDE, RANK_JUMP = _slide_masks(9)  # [col][rank occupancy] -> 9-bit rank mask
+FILE_SLIDE, FILE_JUMP = _slide_masks(10) # [row][file occupancy] -> 10-bit file mask
+# [col][10-bit file mask] -> the same squares as a board bitboard
+FILE_SPREAD = [[sum(1 << (r * 9 + c) for r in range(10) if mask >> r & 1) for mask in range(1 << 10)]
+               for c in range(9)]
+
+def _square_bit(pos):
+    return 1 << (pos[0] * 9 + pos[1])
+
+def _bitboard_step_masks(table):
+    """Flatten a per-square target (or origin) table into one mask per bit index"""
+    return [sum(_square_bit(pos) for pos in table[r][c]) for r in range(10) for c in range(9)]
+
+def _bitboard_gated_masks(table):
+    """Flatten a per-square (pos, gate) table into (gate_bit, mask) pairs grouped by gate square"""
+    flat = []
+    for r in range(10):
+        for c in range(9):
+            by_gate = {}
+            for pos, gate in table[r][c]:
+                by_gate[gate] = by_gate.get(gate, 0) | _square_bit(pos)
+            flat.append([(_square_bit(gate), mask) for gate, mask in by_gate.items()])
+    return flat
+
+BB_GENERAL_TARGETS = {key: _bitboard_step_masks(table) for key, table in GENERAL_TARGETS.items()}
+BB_ADVISOR_TARGETS = {key: _bitboard_step_masks(table) for key, table in ADVISOR_TARGETS.items()}
+BB_PAWN_TARGETS = {key: _bitboard_step_masks(table) for key, table in PAWN_TARGETS.items()}
+BB_ELEPHANT_TARGETS = {key: _bitboard_gated_masks(table) for key, table in ELEPHANT_TARGETS.items()}
+BB_HORSE_TARGETS = _bitboard_gated_masks(HORSE_TARGETS)
+BB_GENERAL_ATTACKERS = {key: _bitboard_step_masks(table) for key, table in GENERAL_ATTACKERS.items()}
+BB_ADVISOR_ATTACKERS = {key: _bitboard_step_masks(table) for key, table in ADVISOR_ATTACKERS.items()}
+BB_PAWN_ATTACKERS = {key: _bitboard_step_masks(table) for key, table in PAWN_ATTACKERS.items()}
+BB_ELEPHANT_ATTACKERS = {key: _bitboard_gated_masks(table) for key, table in ELEPHANT_ATTACKERS.items()}
+BB_HORSE_ATTACKERS = _bitboard_gated_masks(HORSE_ATTACKERS)
+
+def _bits_to_squares(mask):
+    """Position tuples of the set bits of mask, in row-major order"""
+    squares = []
+    while mask:
+        low = mask & -mask
+        squares.append(SQUARE_LIST[low.bit_length() - 1])
+        mask ^= low
+    return squares
+
 # --- Helper Functions ---
 
 def _determine_game_phase(state):
     """ Estimate game phase (0.0 = opening, 1.0 = endgame) based on material """
-    max_material_approx = 2 * (PIECE_VALUES['車'] * 2 + PIECE_VALUES['馬'] * 2 + PIECE_VALUES['炮'] * 2 + \
-                             PIECE_VALUES['相'] * 2 + PIECE_VALUES['仕'] * 2 + PIECE_VALUES['兵'] * 5)
     current_material = 0
     for r in range(10):
         for c in range(9):
             piece = state[r][c]
             if piece and piece[1] not in '帥將': # Exclude kings from phase calc
                 current_material += PIECE_VALUES[piece[1]]
+    return _phase_from_material(current_material)
+
+def _phase_from_material(current_material):
+    """ Game phase for a total of non-general material, see _determine_game_phase """
+    max_material_approx = 2 * (PIECE_VALUES['車'] * 2 + PIECE_VALUES['馬'] * 2 + PIECE_VALUES['炮'] * 2 + \
+                             PIECE_VALUES['相'] * 2 + PIECE_VALUES['仕'] * 2 + PIECE_VALUES['兵'] * 5)
 
     # Normalize phase (simplified): Linear decay based on material remaining
     phase = max(0.0, 1.0 - (current_material / (max_material_approx * 0.7))) # Consider midgame starts early
@@ -203,34 +551,99 @@ def get_pst_score(piece_type, piece_color, r, c, flipped):
 
     return pst_table[lookup_r][lookup_c]
 
-def _get_piece_mobility(validator, state, from_pos, piece_color):
-    """ Calculates the number of *legal* moves for a piece """
-    mobility = 0
+def piece_pst_score(piece, r, c, flipped):
+    """ PST score of a board piece such as 'R車' at (r, c), oriented by its own colour """
+    return get_pst_score(piece[1], piece[0], r, c, flipped)
+
+# --- Vectorized Material/PST Evaluation ---
+# With NumPy a board is an int8 plane of 90 piece codes (see encode_board) and
+# material, river bonuses and PST scores come from lookups into per-code tables
+# already signed for colour (Red positive) and oriented for each flipped value.
+def _material_pst_scores(state, flipped, game_phase):
+    """ Plain Python material and PST totals from Red's perspective (Red minus Black) """
+    material = pst = crossed = 0
+    for r in range(10):
+        for c in range(9):
+            piece = state[r][c]
+            if piece:
+                sign = 1 if piece[0] == 'R' else -1
+                material += sign * PIECE_VALUES[piece[1]]
+                pst += sign * piece_pst_score(piece, r, c, flipped)
+                if piece[1] in '兵卒' and not _on_own_side(piece[0], flipped, r):
+                    crossed += sign
+    pawn_bonus = PAWN_ACROSS_RIVER_BONUS_MG + (PAWN_ACROSS_RIVER_BONUS_EG - PAWN_ACROSS_RIVER_BONUS_MG) * game_phase
+    return material + pawn_bonus * crossed, pst
+
+def _build_eval_tables():
+    """ Per-code value, phase, PST and river tables, indexed [flipped][code][square] where they depend on the flip """
+    values = np.zeros(16, dtype=np.int64)       # Signed material
+    phase_values = np.zeros(16, dtype=np.int64) # Unsigned, generals excluded
+    pst = np.zeros((2, 16, 90), dtype=np.int64)
+    river = np.zeros((2, 16, 90), dtype=np.int64) # +1/-1 where a Red/Black pawn has crossed
+    for piece, code in PIECE_CODES.items():
+        sign = 1 if piece[0] == 'R' else -1
+        values[code] = sign * PIECE_VALUES[piece[1]]
+        if piece[1] not in '帥將':
+            phase_values[code] = PIECE_VALUES[piece[1]]
+        for flipped in (False, True):
+            for r in range(10):
+                for c in range(9):
+                    pst[int(flipped), code, r * 9 + c] = sign * piece_pst_score(piece, r, c, flipped)
+                    if piece[1] in '兵卒' and not _on_own_side(piece[0], flipped, r):
+                        river[int(flipped), code, r * 9 + c] = sign
+    return values, phase_values, pst, river
+
+if np is not None:
+    EVAL_VALUES, EVAL_PHASE_VALUES, EVAL_PST, EVAL_RIVER = _build_eval_tables()
+    EVAL_SQUARE_INDEX = np.arange(90)
+
+def board_planes(boards):
+    """
+    Stack boards into an (N, 90) int8 array of piece codes. Accepts list-of-lists
+    boards or packed 90-byte squares (MCTSNode.packed_state).
+    """
+    return np.array([np.frombuffer(bytes(board), dtype=np.int8) if isinstance(board, (bytes, bytearray))
+                     else np.frombuffer(encode_board(board), dtype=np.int8) for board in boards], dtype=np.int8)
+
+def evaluate_material_pst_batch(planes, flipped):
+    """
+    Material (river bonuses included) and PST totals for every row of an (N, 90)
+    plane array, from Red's perspective. Returns (material, pst) arrays of length N.
+    """
+    f = int(flipped)
+    planes = planes.astype(np.intp)
+    phase = np.array([_phase_from_material(material) for material in EVAL_PHASE_VALUES[planes].sum(axis=1).tolist()])
+    pawn_bonus = PAWN_ACROSS_RIVER_BONUS_MG + (PAWN_ACROSS_RIVER_BONUS_EG - PAWN_ACROSS_RIVER_BONUS_MG) * phase
+    crossed = EVAL_RIVER[f][planes, EVAL_SQUARE_INDEX].sum(axis=1)
+    material = EVAL_VALUES[planes].sum(axis=1) + pawn_bonus * crossed
+    pst = EVAL_PST[f][planes, EVAL_SQUARE_INDEX].sum(axis=1)
+    return material, pst
+
+def _get_piece_mobility(validator, state, from_pos, piece_color, constraints=None, mode='exact'):
+    """
+    Calculates the number of moves for a piece, counted as mode says (see MOBILITY_MODES).
+    Pass validator.king_constraints(piece_color) when scoring many pieces of one position;
+    the 'pseudo' mode never needs it.
+    """
     from_r, from_c = from_pos
     piece = state[from_r][from_c]
     if not piece: return 0
+    if mode not in MOBILITY_MODES:
+        raise ValueError(f"Unknown mobility mode: {mode}")
 
     original_board = validator.board # Remember original validator board ref
     validator.board = state # Point validator to current state for this calc
 
-    for to_r in range(10):
-        for to_c in range(9):
-            to_pos = (to_r, to_c)
-            if validator.is_valid_move(from_pos, to_pos):
-                # Test if the move is legal (doesn't leave king in check)
-                target_piece = state[to_r][to_c]
-                state[to_r][to_c] = piece
-                state[from_r][from_c] = None
-
-                # Check if the king of the moving color is now in check
-                in_check_after_move = validator.is_in_check(piece_color)
-
-                # Undo the move on the temporary state
-                state[from_r][from_c] = piece
-                state[to_r][to_c] = target_piece
-
-                if not in_check_after_move:
-                    mobility += 1
+    if mode == 'pseudo':
+        mobility = len(validator.generate_piece_targets(from_pos))
+    else:
+        if constraints is None:
+            constraints = validator.king_constraints(piece_color)
+        king_pos, _, pinned, _, _ = constraints
+        if mode == 'exact' or from_pos == king_pos or from_pos in pinned:
+            mobility = len(validator.legal_piece_targets(from_pos, piece_color, constraints))
+        else:
+            mobility = len(validator.generate_piece_targets(from_pos))
 
     validator.board = original_board # Restore validator board reference
     return mobility
@@ -368,6 +781,47 @@ class ChessValidator:
         self.game_over = False
         self.board = board # Use the passed board directly
         self.flipped = flipped
+        # Optional cached king squares, see track_kings
+        self.kings = None
+        self._kings_board = None
+
+    def track_kings(self, kings=None):
+        """
+        Cache the king squares so find_kings is an O(1) read. Pass the owner's
+        {'red': pos, 'black': pos} dict to share it (Position does this);
+        otherwise the board is scanned once here. The cache is only trusted
+        while self.board is still the board it was built for.
+        """
+        if kings is None:
+            self.kings = None
+            red_king_pos, black_king_pos = self.find_kings()
+            kings = {'red': red_king_pos, 'black': black_king_pos}
+        self.kings = kings
+        self._kings_board = self.board
+
+    def _trial_move(self, from_pos, to_pos):
+        """Play a move on self.board for a legality test, keeping cached kings current"""
+        board = self.board
+        piece = board[from_pos[0]][from_pos[1]]
+        captured = board[to_pos[0]][to_pos[1]]
+        board[to_pos[0]][to_pos[1]] = piece
+        board[from_pos[0]][from_pos[1]] = None
+        if self.kings is not None and board is self._kings_board:
+            if piece[1] in '帥將':
+                self.kings['red' if piece[0] == 'R' else 'black'] = to_pos
+            if captured and captured[1] in '帥將':
+                self.kings['red' if captured[0] == 'R' else 'black'] = None
+        return piece, captured
+
+    def _undo_trial_move(self, from_pos, to_pos, piece, captured):
+        board = self.board
+        board[from_pos[0]][from_pos[1]] = piece
+        board[to_pos[0]][to_pos[1]] = captured
+        if self.kings is not None and board is self._kings_board:
+            if piece[1] in '帥將':
+                self.kings['red' if piece[0] == 'R' else 'black'] = from_pos
+            if captured and captured[1] in '帥將':
+                self.kings['red' if captured[0] == 'R' else 'black'] = to_pos
 
     # ... [ COPY ALL VALIDATION METHODS from your original file here ] ...
     # find_kings, is_position_under_attack, is_generals_facing, is_in_check,
@@ -378,6 +832,8 @@ class ChessValidator:
     # --- PASTE ChessValidator methods here ---
     def find_kings(self):
         """Find positions of both kings/generals"""
+        if self.kings is not None and self.board is self._kings_board:
+            return self.kings['red'], self.kings['black']
         red_king_pos = black_king_pos = None
         for row in range(10):
             for col in range(9):
@@ -391,36 +847,160 @@ class ChessValidator:
 
     def is_position_under_attack(self, pos, attacking_color):
         """Check if a position is under attack by pieces of the given color"""
-        # Check from all positions on the board
-        for row in range(10):
-            for col in range(9):
-                piece = self.board[row][col]
-                if piece and piece[0] == attacking_color[0].upper():
-                    # Check if this piece can move to the target position
-                    # Need a temporary validator instance with the correct board state if is_valid_move modifies self.board
-                    # Assuming is_valid_move is read-only w.r.t self.board state
-                    if self.is_valid_move((row, col), pos):
-                        return True
-        return False
+        return self.is_square_attacked(pos, attacking_color)
+
+    def is_square_attacked(self, square, by_color):
+        """
+        True if any piece of by_color has a valid move to square.
+        Looks outward from square instead of trying every enemy piece:
+        chariot/cannon rays up to the second blocker, the horse and elephant
+        origins with their leg/eye squares, and pawn, advisor and general steps.
+        """
+        occupant = self.board[square[0]][square[1]]
+        if occupant and occupant[0] == by_color[0].upper():
+            return False # Nothing can capture its own side
+        return bool(self._walk_attackers(square, by_color, first_only=True))
+
+    def attackers_of(self, square, by_color):
+        """
+        Squares of the by_color pieces that can move to square, cheapest piece
+        first. Whatever stands on square counts as capturable, so this also
+        finds the defenders of a by_color piece. Pins are ignored.
+        """
+        board = self.board
+        found = self._walk_attackers(square, by_color, first_only=False)
+        found.sort(key=lambda pos: PIECE_VALUES[board[pos[0]][pos[1]][1]])
+        return found
+
+    def _walk_attackers(self, square, by_color, first_only):
+        """
+        Squares of the by_color pieces that can move to square, found through
+        the attack tables. With first_only the walk stops at the first one.
+        """
+        board = self.board
+        row, col = square
+        color_char = by_color[0].upper()
+        occupied = board[row][col] is not None
+        found = []
+
+        # Chariot: first blocker. Cannon: first blocker onto an empty square,
+        # second blocker (over a screen) onto an occupied one.
+        for ray in RAYS[row][col]:
+            screened = False
+            for r, c in ray:
+                piece = board[r][c]
+                if piece is None:
+                    continue
+                if not screened:
+                    if piece[0] == color_char and (piece[1] == '車' or (piece[1] == '炮' and not occupied)):
+                        found.append((r, c))
+                        if first_only:
+                            return found
+                    if not occupied:
+                        break
+                    screened = True
+                else:
+                    if piece[0] == color_char and piece[1] == '炮':
+                        found.append((r, c))
+                        if first_only:
+                            return found
+                    break
+
+        for (r, c), (leg_r, leg_c) in HORSE_ATTACKERS[row][col]:
+            piece = board[r][c]
+            if piece and piece[0] == color_char and piece[1] == '馬' and board[leg_r][leg_c] is None:
+                found.append((r, c))
+                if first_only:
+                    return found
+
+        key = (color_char, self.flipped)
+        for attackers, piece_types in ((PAWN_ATTACKERS, '兵卒'), (ADVISOR_ATTACKERS, '仕士')):
+            for r, c in attackers[key][row][col]:
+                piece = board[r][c]
+                if piece and piece[0] == color_char and piece[1] in piece_types:
+                    found.append((r, c))
+                    if first_only:
+                        return found
+
+        for (r, c), (eye_r, eye_c) in ELEPHANT_ATTACKERS[key][row][col]:
+            piece = board[r][c]
+            if piece and piece[0] == color_char and piece[1] in '相象' and board[eye_r][eye_c] is None:
+                found.append((r, c))
+                if first_only:
+                    return found
+
+        general_origins = GENERAL_ATTACKERS[key][row][col]
+        if general_origins:
+            red_king_pos, black_king_pos = self.find_kings()
+            other_king_pos = black_king_pos if color_char == 'R' else red_king_pos
+            for r, c in general_origins:
+                piece = board[r][c]
+                if piece and piece[0] == color_char and piece[1] in '帥將' and \
+                        not self._generals_face(square, other_king_pos, vacated=(r, c)):
+                    found.append((r, c))
+                    if first_only:
+                        return found
+
+        return found
+
+    def static_exchange(self, from_pos, to_pos):
+        """
+        Static exchange evaluation: the material the mover nets by capturing on
+        to_pos with the piece on from_pos, after both sides keep recapturing
+        there with their cheapest piece for as long as it pays. The captures
+        are played out on the board, so every line they open or close (a
+        cannon gaining or losing its screen, a chariot behind the capturer) is
+        seen. A general only recaptures onto an undefended square; other pins
+        are ignored. Returns 0 for a non-capture.
+        """
+        board = self.board
+        victim = board[to_pos[0]][to_pos[1]]
+        if not victim:
+            return 0
+        gains = [PIECE_VALUES[victim[1]]]
+        on_square = board[from_pos[0]][from_pos[1]]
+        played = [(from_pos,) + self._trial_move(from_pos, to_pos)]
+        side = 'red' if on_square[0] == 'B' else 'black'
+
+        while True:
+            attackers = self.attackers_of(to_pos, side)
+            if not attackers:
+                break
+            origin = attackers[0]
+            piece, captured = self._trial_move(origin, to_pos)
+            if piece[1] in '帥將' and self.is_in_check(side):
+                self._undo_trial_move(origin, to_pos, piece, captured)
+                break # The general can't take a defended piece, and it is always the last attacker
+            played.append((origin, piece, captured))
+            gains.append(PIECE_VALUES[on_square[1]] - gains[-1])
+            on_square = piece
+            side = 'black' if side == 'red' else 'red'
+
+        for origin, piece, captured in reversed(played):
+            self._undo_trial_move(origin, to_pos, piece, captured)
+
+        # Either side may stop recapturing when continuing would lose more
+        for depth in range(len(gains) - 1, 0, -1):
+            gains[depth - 1] = -max(-gains[depth - 1], gains[depth])
+        return gains[0]
 
     def is_generals_facing(self):
         """Check if the two generals are facing each other directly"""
         red_king_pos, black_king_pos = self.find_kings()
+        return self._generals_face(red_king_pos, black_king_pos)
 
-        if not red_king_pos or not black_king_pos:
+    def _generals_face(self, king_pos, other_king_pos, vacated=None):
+        """True if nothing stands between the two generals on their shared file (vacated counts as empty)"""
+        if not king_pos or not other_king_pos or king_pos == other_king_pos:
             return False
 
-        red_row, red_col = red_king_pos
-        black_row, black_col = black_king_pos
-
-        if red_col != black_col:
+        col = king_pos[1]
+        if other_king_pos[1] != col:
             return False
 
-        start_row = min(red_row, black_row) + 1
-        end_row = max(red_row, black_row)
-
-        for row in range(start_row, end_row):
-            if self.board[row][red_col]:
+        board = self.board
+        for row in range(min(king_pos[0], other_king_pos[0]) + 1, max(king_pos[0], other_king_pos[0])):
+            if board[row][col] and (row, col) != vacated:
                 return False
 
         return True
@@ -440,9 +1020,9 @@ class ChessValidator:
 
         # Check normal attacks
         if color == 'red':
-            return self.is_position_under_attack(red_king_pos, 'black')
+            return self.is_square_attacked(red_king_pos, 'black')
         else: # color == 'black'
-            return self.is_position_under_attack(black_king_pos, 'red')
+            return self.is_square_attacked(black_king_pos, 'red')
 
     def is_checkmate(self, color):
         """
@@ -451,29 +1031,8 @@ class ChessValidator:
         """
         
         # Check if any move escapes check
-        for row in range(10):
-            for col in range(9):
-                piece = self.board[row][col]
-                if piece and piece[0] == color[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            from_pos = (row, col)
-                            to_pos = (to_row, to_col)
-                            if self.is_valid_move(from_pos, to_pos):
-                                # Simulate the move
-                                original_piece_at_to = self.board[to_row][to_col]
-                                self.board[to_row][to_col] = piece
-                                self.board[row][col] = None
-
-                                # Check if still in check
-                                still_in_check = self.is_in_check(color)
-
-                                # Undo the move
-                                self.board[row][col] = piece
-                                self.board[to_row][to_col] = original_piece_at_to
-
-                                if not still_in_check:
-                                    return False # Found a legal move
+        for move in self.iter_legal_moves(color):
+            return False # Found a legal move
 
         # If no legal move escapes check, it's checkmate
         self.game_over = True # Set game over flag
@@ -540,17 +1099,10 @@ class ChessValidator:
         if abs(to_row - from_row) + abs(to_col - from_col) != 1:
             return False
 
-        # Check facing generals rule
-        # Temporarily make the move to check if generals face AFTER the move
-        target_piece = self.board[to_row][to_col]
-        self.board[to_row][to_col] = piece
-        self.board[from_row][from_col] = None
-        generals_face = self.is_generals_facing()
-        # Undo move
-        self.board[from_row][from_col] = piece
-        self.board[to_row][to_col] = target_piece
-
-        if generals_face:
+        # Check facing generals rule on the general's new square, with from_pos vacated
+        red_king_pos, black_king_pos = self.find_kings()
+        other_king_pos = black_king_pos if is_red else red_king_pos
+        if self._generals_face(to_pos, other_king_pos, vacated=from_pos):
              return False # Cannot move into a position where generals face
 
         return True
@@ -719,81 +1271,1098 @@ class ChessValidator:
                     return (to_col == from_col and to_row == from_row - 1) or \
                            (to_row == from_row and abs(to_col - from_col) == 1)
 
+    # --- Table-driven move generation ---
+    def _walk_ray(self, ray, color_char, is_cannon):
+        """Targets along one ray in walk order (chariot slides, cannon needs a screen to capture)"""
+        board = self.board
+        targets = []
+        screened = False
+        for pos in ray:
+            target = board[pos[0]][pos[1]]
+            if not screened:
+                if target is None:
+                    targets.append(pos)
+                elif is_cannon:
+                    screened = True
+                else:
+                    if target[0] != color_char:
+                        targets.append(pos)
+                    break
+            elif target is not None:
+                if target[0] != color_char:
+                    targets.append(pos)
+                break
+        return targets
 
-class MCTSNode:
-    # Make sure it correctly initializes the validator with the flipped status
-    def __init__(self, state, parent=None, move=None, color='black', flipped=False):
-        self.state = state      # The state is already a copy when passed to MCTSNode
-        self.parent = parent
-        self.move = move
-        self.color = color
-        self.children = []
-        self.wins = 0
-        self.visits = 0
-        # Create validator with the state directly, ensuring flipped status is passed
-        self.validator = ChessValidator(self.state, flipped) # Pass flipped status
-        self.untried_moves = self._get_valid_moves(color)
+    def generate_piece_targets(self, from_pos, flying_general=True):
+        """
+        Return every to_pos that is_valid_move accepts for the piece on from_pos,
+        in row-major order. Set flying_general=False to skip the facing-generals
+        test on general moves (the GUI's own validator does not apply it).
+        """
+        from_row, from_col = from_pos
+        board = self.board
+        piece = board[from_row][from_col]
+        if not piece:
+            return []
+        color_char, piece_type = piece[0], piece[1]
+
+        if piece_type in ('車', '炮'):
+            up, left, right, down = RAYS[from_row][from_col]
+            is_cannon = piece_type == '炮'
+            # Reversing the up/left walks keeps the result in row-major order
+            return (self._walk_ray(up, color_char, is_cannon)[::-1] +
+                    self._walk_ray(left, color_char, is_cannon)[::-1] +
+                    self._walk_ray(right, color_char, is_cannon) +
+                    self._walk_ray(down, color_char, is_cannon))
+
+        targets = []
+        if piece_type == '馬':
+            for to_pos, (leg_row, leg_col) in HORSE_TARGETS[from_row][from_col]:
+                if board[leg_row][leg_col] is None:
+                    target = board[to_pos[0]][to_pos[1]]
+                    if target is None or target[0] != color_char:
+                        targets.append(to_pos)
+        elif piece_type in ('相', '象'):
+            for to_pos, (eye_row, eye_col) in ELEPHANT_TARGETS[(color_char, self.flipped)][from_row][from_col]:
+                if board[eye_row][eye_col] is None:
+                    target = board[to_pos[0]][to_pos[1]]
+                    if target is None or target[0] != color_char:
+                        targets.append(to_pos)
+        elif piece_type in ('仕', '士', '兵', '卒'):
+            table = ADVISOR_TARGETS if piece_type in ('仕', '士') else PAWN_TARGETS
+            for to_pos in table[(color_char, self.flipped)][from_row][from_col]:
+                target = board[to_pos[0]][to_pos[1]]
+                if target is None or target[0] != color_char:
+                    targets.append(to_pos)
+        elif piece_type in ('帥', '將'):
+            other_king = None
+            if flying_general:
+                red_king_pos, black_king_pos = self.find_kings()
+                other_king = black_king_pos if color_char == 'R' else red_king_pos
+            for to_pos in GENERAL_TARGETS[(color_char, self.flipped)][from_row][from_col]:
+                target = board[to_pos[0]][to_pos[1]]
+                if target is not None and target[0] == color_char:
+                    continue
+                # The general may not step onto an open file with the enemy general
+                if other_king and self._generals_face(to_pos, other_king, vacated=from_pos):
+                    continue
+                targets.append(to_pos)
+        return targets
 
-        # Store root reference for AI color comparison and flipped status access
-        self.root = self if parent is None else parent.root
+    def generate_pseudo_legal_moves(self, color, flying_general=True):
+        """Yield (from_pos, to_pos) for every move is_valid_move accepts, in board scan order"""
+        color_char = color[0].upper()
+        for row in range(10):
+            board_row = self.board[row]
+            for col in range(9):
+                piece = board_row[col]
+                if piece and piece[0] == color_char:
+                    from_pos = SQUARES[row][col]
+                    for to_pos in self.generate_piece_targets(from_pos, flying_general):
+                        yield (from_pos, to_pos)
 
-    # Ensure _get_valid_moves uses self.validator correctly
-    def _get_valid_moves(self, color=None):
-        moves = []
-        current_color = color if color else self.color
-        # Make sure validator uses the node's state
-        original_board = self.validator.board
-        self.validator.board = self.state
+    def generate_legal_moves(self, color):
+        """Return pseudo-legal moves that do not leave the mover's own king in check"""
+        return list(self.iter_legal_moves(color))
 
+    def check_candidates(self, color):
+        """
+        A test could_check(from_pos, to_pos) that is False only for moves of
+        color that cannot give check: a checker must land on or leave the
+        enemy general's rank or file (direct chariot, cannon, pawn or general
+        checks, discovered checks, a new or removed cannon screen), be a horse
+        landing where it attacks the general (reverse horse table), or leave a
+        square diagonally next to the general, the leg of any horse aiming at
+        it. Returns None if a general is missing, when nothing can be in check.
+        The test reads this board, so call it before making the move (it looks
+        up the moving piece on from_pos), never on the board after it.
+        """
+        red_king_pos, black_king_pos = self.find_kings()
+        if not red_king_pos or not black_king_pos:
+            return None
+        king_row, king_col = black_king_pos if color == 'red' else red_king_pos
+        # A check already on the board (only when color is not the side to move) may survive any move
+        if self.is_in_check('black' if color == 'red' else 'red'):
+            return lambda from_pos, to_pos: True
+        horse_squares = {origin for origin, _ in HORSE_ATTACKERS[king_row][king_col]}
+        leg_squares = {(king_row + dr, king_col + dc) for dr in (-1, 1) for dc in (-1, 1)}
+        board = self.board
+
+        def could_check(from_pos, to_pos):
+            return (from_pos[0] == king_row or from_pos[1] == king_col or
+                    to_pos[0] == king_row or to_pos[1] == king_col or from_pos in leg_squares or
+                    (to_pos in horse_squares and board[from_pos[0]][from_pos[1]][1] == '馬'))
+        return could_check
+
+    def generate_checks(self, color):
+        """Legal moves of color that give check, in scan order, playing out only check_candidates"""
+        could_check = self.check_candidates(color)
+        if could_check is None:
+            return [] # Nothing can be in check without both generals
+        enemy_color = 'black' if color == 'red' else 'red'
+        checks = []
+        for from_pos, to_pos in self.generate_pseudo_legal_moves(color):
+            if not could_check(from_pos, to_pos):
+                continue
+            piece, captured = self._trial_move(from_pos, to_pos)
+            gives_check = not self.is_in_check(color) and self.is_in_check(enemy_color)
+            self._undo_trial_move(from_pos, to_pos, piece, captured)
+            if gives_check:
+                checks.append((from_pos, to_pos))
+        return checks
+
+    def iter_legal_moves(self, color, constraints=None):
+        """Yield legal moves in scan order, only playing out the moves king_constraints flags"""
+        if constraints is None:
+            constraints = self.king_constraints(color)
         for row in range(10):
+            board_row = self.board[row]
             for col in range(9):
-                piece = self.state[row][col]
-                if piece and piece[0] == current_color[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            from_pos = (row, col)
-                            to_pos = (to_row, to_col)
-                            if self.validator.is_valid_move(from_pos, to_pos):
-                                # Test if move would result in check for the moving player
-                                original_piece_at_to = self.state[to_row][to_col]
-                                self.state[to_row][to_col] = piece
-                                self.state[row][col] = None
+                piece = board_row[col]
+                if piece and piece[0] == color[0].upper():
+                    from_pos = SQUARES[row][col]
+                    for to_pos in self.legal_piece_targets(from_pos, color, constraints):
+                        yield (from_pos, to_pos)
+
+    def legal_piece_targets(self, from_pos, color, constraints):
+        """Legal destinations for the piece on from_pos, given king_constraints(color)"""
+        targets = self.generate_piece_targets(from_pos)
+        king_pos, checkers, pinned, unsafe_to, verify_all = constraints
+        if king_pos is None:
+            return targets # A general is missing, so nothing can be in check
+        if from_pos == king_pos or verify_all:
+            return [to_pos for to_pos in targets if self._leaves_king_safe(from_pos, to_pos, color)]
+        if checkers:
+            # Only captures, blocks and screen changes against every checker can evade
+            return [to_pos for to_pos in targets
+                    if all(to_pos in to_mask or from_pos in from_mask for to_mask, from_mask in checkers)
+                    and self._leaves_king_safe(from_pos, to_pos, color)]
+        if from_pos in pinned:
+            return [to_pos for to_pos in targets if self._leaves_king_safe(from_pos, to_pos, color)]
+        if unsafe_to:
+            return [to_pos for to_pos in targets
+                    if to_pos not in unsafe_to or self._leaves_king_safe(from_pos, to_pos, color)]
+        return targets
+
+    def _leaves_king_safe(self, from_pos, to_pos, color):
+        piece, captured = self._trial_move(from_pos, to_pos)
+        in_check = self.is_in_check(color)
+        self._undo_trial_move(from_pos, to_pos, piece, captured)
+        return not in_check
+
+    def king_constraints(self, color):
+        """
+        Checkers and pins against color's general, computed once per position.
+        Returns (king_pos, checkers, pinned, unsafe_to, verify_all), with
+        king_pos None if either general is missing (is_in_check is then always False):
+          checkers   - one (to_mask, from_mask) pair per checking piece; a non-general
+                       move can only evade if it lands in to_mask (capture/block/extra
+                       cannon screen, or taking the enemy general) or leaves from_mask
+                       (the cannon's screen)
+          pinned     - squares of our pieces that may expose the general if they move:
+                       the only blocker before a chariot or the enemy general, either
+                       of two screens before a cannon, a piece on an enemy horse leg
+          unsafe_to  - empty squares between the general and an enemy cannon, where
+                       landing a piece would give the cannon a screen
+          verify_all - an unusual attacker (enemy general) that the masks don't model
+        General moves and flagged moves are still verified individually.
+        """
+        red_king_pos, black_king_pos = self.find_kings()
+        if not red_king_pos or not black_king_pos:
+            return None, [], set(), set(), False
+        king_pos = red_king_pos if color == 'red' else black_king_pos
+        board = self.board
+        own_char = color[0].upper()
+        enemy_char = 'B' if own_char == 'R' else 'R'
+        checkers = []
+        pinned = set()
+        unsafe_to = set()
+        verify_all = False
+
+        for direction, ray in enumerate(RAYS[king_pos[0]][king_pos[1]]):
+            vertical = direction in (0, 3) # Rays are up, left, right, down
+            blockers = []
+            empties = [] # Squares before the first blocker
+            between = [] # Squares between the first and second blocker
+            for r, c in ray:
+                piece = board[r][c]
+                if piece is None:
+                    if not blockers:
+                        empties.append((r, c))
+                    elif len(blockers) == 1:
+                        between.append((r, c))
+                    continue
+                blockers.append(((r, c), piece))
+                if len(blockers) == 3:
+                    break
+            if not blockers:
+                continue
 
-                                # Use the validator (already pointing to self.state)
-                                still_in_check = self.validator.is_in_check(current_color)
+            first_pos, first = blockers[0]
+            if first[0] == enemy_char and (first[1] == '車' or (vertical and first[1] in '帥將')):
+                checkers.append((set(empties) | {first_pos}, ()))
+            elif first[0] == enemy_char and first[1] == '炮':
+                unsafe_to.update(empties)
+            if len(blockers) < 2:
+                continue
 
-                                # Undo move on the state
-                                self.state[row][col] = piece
-                                self.state[to_row][to_col] = original_piece_at_to
+            second_pos, second = blockers[1]
+            if second[0] == enemy_char and second[1] == '炮':
+                checkers.append((set(empties) | set(between) | {second_pos},
+                                 (first_pos,) if first[0] == own_char else ()))
+            elif first[0] == own_char and second[0] == enemy_char and \
+                    (second[1] == '車' or (vertical and second[1] in '帥將')):
+                pinned.add(first_pos)
+            if len(blockers) == 3:
+                third_pos, third = blockers[2]
+                if third[0] == enemy_char and third[1] == '炮':
+                    for pos, piece in blockers[:2]:
+                        if piece[0] == own_char:
+                            pinned.add(pos)
+
+        row, col = king_pos
+        for origin, leg in HORSE_ATTACKERS[row][col]:
+            piece = board[origin[0]][origin[1]]
+            if piece and piece[0] == enemy_char and piece[1] == '馬':
+                leg_piece = board[leg[0]][leg[1]]
+                if leg_piece is None:
+                    checkers.append(({origin, leg}, ()))
+                elif leg_piece[0] == own_char:
+                    pinned.add(leg)
+
+        key = (enemy_char, self.flipped)
+        for attackers, piece_types in ((PAWN_ATTACKERS, '兵卒'), (ADVISOR_ATTACKERS, '仕士')):
+            for origin in attackers[key][row][col]:
+                piece = board[origin[0]][origin[1]]
+                if piece and piece[0] == enemy_char and piece[1] in piece_types:
+                    checkers.append(({origin}, ()))
+        for origin, eye in ELEPHANT_ATTACKERS[key][row][col]:
+            piece = board[origin[0]][origin[1]]
+            if piece and piece[0] == enemy_char and piece[1] in '相象':
+                eye_piece = board[eye[0]][eye[1]]
+                if eye_piece is None:
+                    checkers.append(({origin, eye}, ()))
+                elif eye_piece[0] == own_char:
+                    pinned.add(eye)
+        for origin in GENERAL_ATTACKERS[key][row][col]:
+            piece = board[origin[0]][origin[1]]
+            if piece and piece[0] == enemy_char and piece[1] in '帥將':
+                verify_all = True
+
+        # Capturing the enemy general also ends the check (is_in_check needs both generals)
+        enemy_king_pos = black_king_pos if color == 'red' else red_king_pos
+        for to_mask, from_mask in checkers:
+            to_mask.add(enemy_king_pos)
+
+        return king_pos, checkers, pinned, unsafe_to, verify_all
+
+
+class BitboardValidator(ChessValidator):
+    """
+    ChessValidator backed by 90-bit integers: one bitboard per piece code, the
+    occupancy of each side and rank/file occupancy for slider lookups. The
+    list board is still kept (and stays authoritative), so every method not
+    overridden here works unchanged.
+
+    The bitboards follow moves made through _trial_move/_undo_trial_move (which
+    Position.make_move uses) and are rebuilt when self.board is replaced; call
+    sync() after editing the board any other way.
+    """
+    def __init__(self, board, flipped=False):
+        super().__init__(board, flipped)
+        self._bb_board = None
+        self.sync()
+
+    def sync(self):
+        """Rebuild every bitboard from self.board"""
+        pieces = [0] * 16 # Indexed by piece code
+        rank_occ = [0] * 10
+        file_occ = [0] * 9
+        for r in range(10):
+            board_row = self.board[r]
+            for c in range(9):
+                piece = board_row[c]
+                if piece:
+                    pieces[PIECE_CODES[piece]] |= 1 << (r * 9 + c)
+                    rank_occ[r] |= 1 << c
+                    file_occ[c] |= 1 << r
+        self.pieces = pieces
+        self.side_occ = [sum(pieces[1:8]), sum(pieces[9:16])] # Red, Black
+        self.occupied = self.side_occ[0] | self.side_occ[1]
+        self.rank_occ = rank_occ
+        self.file_occ = file_occ
+        self._bb_board = self.board
+
+    def _move_bits(self, piece, captured, from_pos, to_pos):
+        """Toggle piece from from_pos to to_pos (or back), adding/removing captured on to_pos"""
+        from_bit = 1 << (from_pos[0] * 9 + from_pos[1])
+        to_bit = 1 << (to_pos[0] * 9 + to_pos[1])
+        code = PIECE_CODES[piece]
+        self.pieces[code] ^= from_bit | to_bit
+        self.side_occ[code >> 3] ^= from_bit | to_bit
+        if captured:
+            captured_code = PIECE_CODES[captured]
+            self.pieces[captured_code] ^= to_bit
+            self.side_occ[captured_code >> 3] ^= to_bit
+        self.occupied = self.side_occ[0] | self.side_occ[1]
+        self.rank_occ[from_pos[0]] ^= 1 << from_pos[1]
+        self.file_occ[from_pos[1]] ^= 1 << from_pos[0]
+        if not captured: # A capture leaves the target square occupied
+            self.rank_occ[to_pos[0]] ^= 1 << to_pos[1]
+            self.file_occ[to_pos[1]] ^= 1 << to_pos[0]
+
+    def _trial_move(self, from_pos, to_pos):
+        if self.board is not self._bb_board:
+            self.sync()
+        piece, captured = super()._trial_move(from_pos, to_pos)
+        self._move_bits(piece, captured, from_pos, to_pos)
+        return piece, captured
+
+    def _undo_trial_move(self, from_pos, to_pos, piece, captured):
+        super()._undo_trial_move(from_pos, to_pos, piece, captured)
+        self._move_bits(piece, captured, from_pos, to_pos)
+
+    def _slide(self, row, col):
+        """Rank and file squares up to and including the first blocker each way"""
+        return (RANK_SLIDE[col][self.rank_occ[row]] << (row * 9) |
+                FILE_SPREAD[col][FILE_SLIDE[row][self.file_occ[col]]])
+
+    def _jump(self, row, col):
+        """Rank and file second blockers, the squares a cannon could capture on"""
+        return (RANK_JUMP[col][self.rank_occ[row]] << (row * 9) |
+                FILE_SPREAD[col][FILE_JUMP[row][self.file_occ[col]]])
 
-                                if not still_in_check:
-                                    moves.append((from_pos, to_pos))
+    def find_kings(self):
+        """Find positions of both kings/generals"""
+        if self.kings is not None and self.board is self._kings_board:
+            return self.kings['red'], self.kings['black']
+        if self.board is not self._bb_board:
+            self.sync()
+        # Highest bit, as the mailbox scan keeps the last general it finds
+        red_generals, black_generals = self.pieces[1], self.pieces[1 | BLACK_BIT]
+        return (SQUARE_LIST[red_generals.bit_length() - 1] if red_generals else None,
+                SQUARE_LIST[black_generals.bit_length() - 1] if black_generals else None)
+
+    def is_square_attacked(self, square, by_color):
+        """Bitboard version of ChessValidator.is_square_attacked"""
+        if self.board is not self._bb_board:
+            self.sync()
+        row, col = square
+        bit = 1 << (row * 9 + col)
+        side = 0 if by_color == 'red' else 1
+        if self.side_occ[side] & bit:
+            return False # Nothing can capture its own side
+        pieces = self.pieces
+        base = side * BLACK_BIT
+        occupied = self.occupied
+        index = row * 9 + col
+
+        chariots = pieces[base | 5]
+        cannons = pieces[base | 6]
+        if chariots or cannons:
+            slide = self._slide(row, col)
+            if slide & chariots:
+                return True
+            if cannons:
+                # Onto an empty square a cannon slides, onto an occupied one it jumps a screen
+                if not occupied & bit:
+                    if slide & cannons:
+                        return True
+                elif self._jump(row, col) & cannons:
+                    return True
+
+        horses = pieces[base | 4]
+        if horses:
+            for leg_bit, origins in BB_HORSE_ATTACKERS[index]:
+                if horses & origins and not occupied & leg_bit:
+                    return True
+
+        key = ('R' if side == 0 else 'B', self.flipped)
+        if BB_PAWN_ATTACKERS[key][index] & pieces[base | 7]:
+            return True
+        if BB_ADVISOR_ATTACKERS[key][index] & pieces[base | 2]:
+            return True
 
-        # Restore validator's original board if necessary (though it might not matter if validator is recreated often)
-        # self.validator.board = original_board # Probably not needed if validator state isn't reused across nodes directly
+        elephants = pieces[base | 3]
+        if elephants:
+            for eye_bit, origins in BB_ELEPHANT_ATTACKERS[key][index]:
+                if elephants & origins and not occupied & eye_bit:
+                    return True
 
-        return moves
+        generals = BB_GENERAL_ATTACKERS[key][index] & pieces[base | 1]
+        if generals:
+            red_king_pos, black_king_pos = self.find_kings()
+            other_king_pos = black_king_pos if side == 0 else red_king_pos
+            for origin in _bits_to_squares(generals):
+                if not self._generals_face(square, other_king_pos, vacated=origin):
+                    return True
+
+        return False
+
+    def generate_piece_targets(self, from_pos, flying_general=True):
+        """Bitboard version of ChessValidator.generate_piece_targets, same targets and order"""
+        if self.board is not self._bb_board:
+            self.sync()
+        from_row, from_col = from_pos
+        piece = self.board[from_row][from_col]
+        if not piece:
+            return []
+        code = PIECE_CODES[piece]
+        kind = code & 7
+        side = code >> 3
+        index = from_row * 9 + from_col
+        own = self.side_occ[side]
+        occupied = self.occupied
+        key = (piece[0], self.flipped)
+
+        if kind == 5: # Chariot
+            return _bits_to_squares(self._slide(from_row, from_col) & ~own)
+        if kind == 6: # Cannon
+            return _bits_to_squares((self._slide(from_row, from_col) & ~occupied) |
+                                    (self._jump(from_row, from_col) & self.side_occ[1 - side]))
+        if kind == 4: # Horse
+            targets = 0
+            for leg_bit, mask in BB_HORSE_TARGETS[index]:
+                if not occupied & leg_bit:
+                    targets |= mask
+            return _bits_to_squares(targets & ~own)
+        if kind == 3: # Elephant
+            targets = 0
+            for eye_bit, mask in BB_ELEPHANT_TARGETS[key][index]:
+                if not occupied & eye_bit:
+                    targets |= mask
+            return _bits_to_squares(targets & ~own)
+        if kind == 2:
+            return _bits_to_squares(BB_ADVISOR_TARGETS[key][index] & ~own)
+        if kind == 7:
+            return _bits_to_squares(BB_PAWN_TARGETS[key][index] & ~own)
+
+        targets = _bits_to_squares(BB_GENERAL_TARGETS[key][index] & ~own)
+        if flying_general:
+            red_king_pos, black_king_pos = self.find_kings()
+            other_king = black_king_pos if side == 0 else red_king_pos
+            if other_king:
+                # The general may not step onto an open file with the enemy general
+                targets = [to_pos for to_pos in targets
+                           if not self._generals_face(to_pos, other_king, vacated=from_pos)]
+        return targets
+
+
+# --- Validator Backends ---
+# 'mailbox' walks the list board, 'bitboard' answers the same questions from
+# BitboardValidator's integers. Both give identical moves in identical order.
+VALIDATOR_BACKEND = 'mailbox' # Used when no backend is passed
+VALIDATOR_BACKENDS = {
+    'mailbox': ChessValidator,
+    'bitboard': BitboardValidator,
+}
+
+def create_validator(board, flipped=False, backend=None):
+    """Build a validator for board with the named backend (default VALIDATOR_BACKEND)"""
+    backend = backend or VALIDATOR_BACKEND
+    if backend not in VALIDATOR_BACKENDS:
+        raise ValueError(f"Unknown validator backend: {backend}")
+    return VALIDATOR_BACKENDS[backend](board, flipped)
+
+def generate_moves(board, color, flipped=False, kings=None, backend=None):
+    """
+    Legal moves for color on board without building a Position or search node.
+    kings is an optional (red, black) pair of general squares already known to
+    the caller; board is only read.
+    """
+    validator = create_validator(board, flipped, backend)
+    if kings is not None:
+        validator.track_kings({'red': kings[0], 'black': kings[1]})
+    return validator.generate_legal_moves(color)
+
+def benchmark_validator_backends(boards, flipped=False, repeat=3, backends=None):
+    """
+    Time each backend on the search workload over a list of boards: legal move
+    generation and check tests for both sides, plus a make/unmake of every move.
+    Returns {backend: best seconds out of repeat runs}.
+    """
+    results = {}
+    for backend in backends or VALIDATOR_BACKENDS:
+        best = None
+        for _ in range(repeat):
+            positions = [Position([row[:] for row in board], 'red', flipped, backend) for board in boards]
+            start = time.time()
+            for position in positions:
+                for color in ('red', 'black'):
+                    position.is_in_check(color)
+                    for move in position.legal_moves(color):
+                        position.unmake_move(position.make_move(move))
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[backend] = best
+    return results
+
+
+class Position:
+    """
+    Mutable search position. The board is changed in place by make_move and
+    restored by unmake_move, which also keep the king squares, side to move,
+    material counters and Zobrist hash up to date. backend picks the
+    validator implementation, see create_validator.
+    """
+    def __init__(self, board, color, flipped=False, backend=None):
+        self.board = board # Mutated in place, copy it first if the caller still needs it
+        self.color = color # Side to move
+        self.flipped = flipped
+        self.validator = create_validator(board, flipped, backend)
+
+        self.kings = {'red': None, 'black': None}
+        self.material = {'red': 0, 'black': 0} # Excludes the generals
+        self.hash = compute_zobrist_hash(board, color)
+        for row in range(10):
+            for col in range(9):
+                piece = board[row][col]
+                if piece:
+                    piece_color = 'red' if piece[0] == 'R' else 'black'
+                    if piece[1] in '帥將':
+                        self.kings[piece_color] = (row, col)
+                    else:
+                        self.material[piece_color] += PIECE_VALUES[piece[1]]
+        # The validator reads king squares from the dict make/unmake maintain
+        self.validator.track_kings(self.kings)
+
+    def make_move(self, move):
+        """Play move on the board and return the token needed to undo it"""
+        from_pos, to_pos = move
+        (from_row, from_col), (to_row, to_col) = move
+        # The validator moves the piece and updates the shared king squares
+        piece, captured = self.validator._trial_move(from_pos, to_pos)
+        token = (move, piece, captured, self.hash)
+
+        mover = self.color
+        opponent = 'black' if mover == 'red' else 'red'
+        if captured and captured[1] not in '帥將':
+            self.material['red' if captured[0] == 'R' else 'black'] -= PIECE_VALUES[captured[1]]
+
+        # XOR the mover out of from_pos and into to_pos, the captured piece out, and flip the side
+        from_sq = from_row * 9 + from_col
+        to_sq = to_row * 9 + to_col
+        base = ZOBRIST_PIECE_BASE[piece]
+        h = self.hash ^ ZOBRIST_KEYS[base + from_sq] ^ ZOBRIST_KEYS[base + to_sq]
+        if captured:
+            h ^= ZOBRIST_KEYS[ZOBRIST_PIECE_BASE[captured] + to_sq]
+        self.hash = h ^ ZOBRIST_SIDE[mover] ^ ZOBRIST_SIDE[opponent]
+
+        self.color = opponent
+        return token
+
+    def unmake_move(self, token):
+        """Take back the move that produced token"""
+        move, piece, captured, old_hash = token
+        from_pos, to_pos = move
+        self.validator._undo_trial_move(from_pos, to_pos, piece, captured)
+
+        if captured and captured[1] not in '帥將':
+            self.material['red' if captured[0] == 'R' else 'black'] += PIECE_VALUES[captured[1]]
+
+        self.hash = old_hash
+        self.color = 'black' if self.color == 'red' else 'red'
+
+    def legal_moves(self, color=None):
+        return self.validator.generate_legal_moves(color or self.color)
+
+    def checking_moves(self, color=None):
+        """Legal moves that give check, see ChessValidator.generate_checks"""
+        return self.validator.generate_checks(color or self.color)
+
+    def is_in_check(self, color=None):
+        return self.validator.is_in_check(color or self.color)
+
+    def is_checkmate(self, color=None):
+        return self.validator.is_checkmate(color or self.color)
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results, packed two 64-bit words per entry
+    (full Zobrist key, then data) in an array('Q') sized to size_mb. Each
+    bucket holds a depth-preferred entry, replaced only by deeper (or equal)
+    results or results from a newer search, and an always-replace entry.
+    Keep one alive across moves and call new_search before each search.
+
+    Data word: bits 0-13 move (see pack_move, 0 for none),
+    16-23 depth, 24-25 bound flag, 26-31 search age, 32-63 score + 2**31.
+    """
+    ENTRY_WORDS = 2
+    BUCKET_WORDS = 4 # Depth-preferred entry, then always-replace entry
+
+    def __init__(self, size_mb=TRANSPOSITION_TABLE_MB):
+        self.buckets = max(1, int(size_mb * (1 << 20)) // (self.BUCKET_WORDS * 8))
+        self.words = array('Q', bytes(self.buckets * self.BUCKET_WORDS * 8))
+        self.age = 0
+
+    def new_search(self):
+        """Mark later stores as newer than everything already in the table"""
+        self.age = (self.age + 1) & 63
+
+    def clear(self):
+        self.words = array('Q', bytes(self.buckets * self.BUCKET_WORDS * 8))
+        self.age = 0
+
+    def probe(self, key):
+        """Return (depth, flag, score, move) stored for key, or None"""
+        words = self.words
+        index = (key % self.buckets) * self.BUCKET_WORDS
+        if words[index] == key:
+            data = words[index + 1]
+        elif words[index + 2] == key:
+            data = words[index + 3]
+        else:
+            return None
+        return (data >> 16) & 0xFF, (data >> 24) & 3, (data >> 32) - (1 << 31), unpack_move(data & 0x3FFF)
+
+    def store(self, key, depth, flag, score, move=None):
+        words = self.words
+        index = (key % self.buckets) * self.BUCKET_WORDS
+        data = (pack_move(move) | min(depth, 0xFF) << 16 | flag << 24 | self.age << 26 |
+                (score + (1 << 31)) << 32)
+        stored = words[index + 1]
+        if words[index] == key or depth >= (stored >> 16) & 0xFF or (stored >> 26) & 63 != self.age:
+            words[index] = key
+            words[index + 1] = data
+        else:
+            words[index + 2] = key
+            words[index + 3] = data
+
+
+class MoveOrdering:
+    """
+    Quiet move ordering shared by the searches, kept across iterations and
+    moves: KILLER_SLOTS killer moves per ply (quiet moves that caused a cutoff
+    at that ply), a butterfly history table of cutoff credit indexed by packed
+    move (see pack_move), and a countermove table holding the quiet move that
+    last refuted each move. Call new_search before each search to age the
+    history.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.killers = [] # Per ply, most recent first, 0 for an empty slot
+        self.history = array('L', [0]) * (1 << 14)
+        self.countermoves = array('H', [0]) * (1 << 14)
+        self.history_peak = 0
+
+    def new_search(self):
+        """Halve the history so recent searches weigh more"""
+        history = self.history
+        for code in range(len(history)):
+            history[code] >>= 1
+        self.history_peak >>= 1
+
+    def record_cutoff(self, move, depth, ply=None, previous=None):
+        """Credit quiet move with a cutoff (or a proof) at ply, depth plies from the horizon"""
+        code = pack_move(move)
+        if ply is not None:
+            while len(self.killers) <= ply:
+                self.killers.append([0] * KILLER_SLOTS)
+            killers = self.killers[ply]
+            if killers[0] != code:
+                killers.insert(0, code)
+                killers.pop()
+        if previous:
+            self.countermoves[pack_move(previous)] = code
+        score = self.history[code] + depth * depth
+        self.history[code] = score
+        if score > self.history_peak:
+            self.history_peak = score
+            if score >= HISTORY_LIMIT:
+                self.new_search()
+
+    def quiet_score(self, move, ply=None, previous=None):
+        """Sort key for a quiet move, higher first: killers, then the countermove, then by history"""
+        code = pack_move(move)
+        score = self.history[code]
+        if ply is not None and ply < len(self.killers) and code in self.killers[ply]:
+            score += (KILLER_SLOTS - self.killers[ply].index(code) + 1) * HISTORY_LIMIT
+        if previous and self.countermoves[pack_move(previous)] == code:
+            score += HISTORY_LIMIT
+        return score
+
+    def order_quiet(self, moves, ply=None, previous=None):
+        """moves sorted by quiet_score, best first (stable for equal scores)"""
+        return sorted(moves, key=lambda move: -self.quiet_score(move, ply, previous))
+
+    def history_share(self, move):
+        """move's history score relative to the highest one, in [0, 1]"""
+        return self.history[pack_move(move)] / self.history_peak if self.history_peak else 0
+
+
+class ProofNumberSearch:
+    """
+    Depth-first proof-number (df-pn) solver: proves or disproves that the side
+    to move in position can force mate. With checks_only the mating side only
+    tries checking moves, which keeps long check sequences tractable. The
+    defender may answer with any legal move, and having no legal move loses
+    (as in ChessValidator.is_checkmate). A position repeating on the current
+    line counts as an escape.
+
+    Values are stored from the side to move's view: phi is the cost of proving
+    the side to move wins, delta the cost of proving it loses. The search
+    stops after node_budget expansions or at deadline, and the table of
+    (phi, delta, work) entries is pruned whenever it outgrows memory_mb.
+    """
+    def __init__(self, position, node_budget=PN_NODE_BUDGET, memory_mb=PN_TABLE_MB, deadline=None,
+                 checks_only=True):
+        self.position = position # Searched in place with make/unmake, left as it was
+        self.attacker = position.color
+        self.node_budget = node_budget
+        self.max_entries = max(1, int(memory_mb * (1 << 20)) // PN_TABLE_ENTRY_BYTES)
+        self.deadline = deadline
+        self.checks_only = checks_only
+        self.table = {} # hash -> (phi, delta, work)
+        self.path = set() # Hashes on the current line, for repetitions
+        self.nodes = 0
+
+    def solve(self):
+        """Return 'proven', 'disproven' or 'unknown' (budget or time ran out)"""
+        try:
+            self._mid(self.position, PN_INFINITY, PN_INFINITY)
+        except TimeoutError:
+            pass
+        phi, delta, _ = self.table.get(self.position.hash, (1, 1, 0))
+        if phi == 0:
+            return 'proven'
+        if delta == 0:
+            return 'disproven'
+        return 'unknown'
+
+    def _mid(self, position, th_phi, th_delta):
+        self.nodes += 1
+        if self.nodes > self.node_budget:
+            raise TimeoutError("Proof-number search node budget exhausted")
+        if self.deadline is not None and self.nodes & 15 == 0 and time.time() > self.deadline:
+            raise TimeoutError("Proof-number search timeout")
+
+        key = position.hash
+        children = self._children(position)
+        if not children:
+            self._store(key, PN_INFINITY, 0, 0) # The side to move has nothing left
+            return
+
+        start_nodes = self.nodes
+        self.path.add(key)
+        try:
+            while True:
+                # phi is the cheapest child disproof, delta the sum of child proofs
+                phi = PN_INFINITY
+                delta = 0
+                best_index = 0
+                second_delta = PN_INFINITY
+                for index, (_, child_key) in enumerate(children):
+                    child_phi, child_delta = self._lookup(child_key, position.color)
+                    delta = min(PN_INFINITY, delta + child_phi)
+                    if child_delta < phi:
+                        second_delta = phi
+                        phi = child_delta
+                        best_index = index
+                    elif child_delta < second_delta:
+                        second_delta = child_delta
+                if phi >= th_phi or delta >= th_delta:
+                    self._store(key, phi, delta, self.nodes - start_nodes)
+                    return
+
+                move, child_key = children[best_index]
+                child_phi, child_delta = self._lookup(child_key, position.color)
+                child_th_phi = min(PN_INFINITY, th_delta + child_phi - delta)
+                child_th_delta = min(th_phi, second_delta + 1)
+                token = position.make_move(move)
+                try:
+                    self._mid(position, child_th_phi, child_th_delta)
+                finally:
+                    position.unmake_move(token)
+        finally:
+            self.path.discard(key)
+
+    def _lookup(self, child_key, parent_color):
+        """(phi, delta) of a child reached by parent_color's move"""
+        if child_key in self.path:
+            # A repetition: the attacker failed to make progress
+            return (PN_INFINITY, 0) if parent_color != self.attacker else (0, PN_INFINITY)
+        entry = self.table.get(child_key)
+        return (entry[0], entry[1]) if entry else (1, 1)
+
+    def _children(self, position):
+        """(move, child hash) for the moves searched from position"""
+        if self.checks_only and position.color == self.attacker:
+            moves = position.checking_moves()
+        else:
+            moves = position.legal_moves()
+        children = []
+        for move in moves:
+            token = position.make_move(move)
+            children.append((move, position.hash))
+            position.unmake_move(token)
+        return children
+
+    def _store(self, key, phi, delta, work):
+        self.table[key] = (phi, delta, work)
+        if len(self.table) > self.max_entries:
+            self._collect_garbage()
+
+    def _collect_garbage(self):
+        """Drop the cheaper half of the unsolved entries (solved ones are needed for the mating line)"""
+        unsolved = sorted(entry[2] for entry in self.table.values() if entry[0] and entry[1])
+        if not unsolved:
+            return
+        cutoff = unsolved[len(unsolved) // 2]
+        self.table = {key: entry for key, entry in self.table.items()
+                      if not (entry[0] and entry[1]) or entry[2] > cutoff}
+
+    def mating_line(self):
+        """
+        The attacker's moves of a proven mate, in the find_mate_in_n format
+        (defender replies left out). Follows the shortest proven attacking move
+        and the longest-resisting defence.
+        """
+        line = self._proof_line(self.position, {}, set())
+        return line[1] if line else None
+
+    def _proof_line(self, position, memo, on_line):
+        """(plies to mate, attacker moves) under position, or None if the table doesn't prove it"""
+        key = position.hash
+        if key in memo:
+            return memo[key]
+        if key in on_line:
+            return None
+        attacking = position.color == self.attacker
+        children = self._children(position)
+        if not children:
+            return None if attacking else (0, [])
+
+        on_line.add(key)
+        best = None
+        for move, child_key in children:
+            child_phi, child_delta = self._lookup(child_key, position.color)
+            # A proven child is a loss for its side to move if the defender moves there, a win otherwise
+            proven = child_delta == 0 if attacking else child_phi == 0
+            if not proven:
+                if attacking:
+                    continue
+                best = None # An unproven defence, the table doesn't hold the whole proof
+                break
+            token = position.make_move(move)
+            child_line = self._proof_line(position, memo, on_line)
+            position.unmake_move(token)
+            if child_line is None:
+                if attacking:
+                    continue
+                best = None
+                break
+            plies, moves = child_line
+            candidate = (plies + 1, [move] + moves if attacking else moves)
+            if best is None or (candidate[0] < best[0] if attacking else candidate[0] > best[0]):
+                best = candidate
+        on_line.discard(key)
+        memo[key] = best
+        return best
+
+
+class MCTSNode:
+    """
+    Search tree node. Only a root keeps a board (packed, see encode_board);
+    other nodes rebuild theirs by replaying the packed moves from the root.
+    Statistics of a node's children sit in parallel arrays on the node,
+    indexed like children, and each child reads its own through its parent.
+    """
+    __slots__ = ('parent', 'index', 'code', 'color', 'flipped', 'hash', 'king_squares', 'packed_state',
+                 'children', 'child_visits', 'child_wins', 'child_priors', 'child_virtual', 'child_amaf_visits',
+                 'child_amaf_wins', '_untried', '_untried_priors', '_visits', '_wins')
+
+    def __init__(self, state, parent=None, move=None, color='black', flipped=False, zobrist_hash=None, kings=None):
+        self.parent = parent
+        self.code = pack_move(move) # 0 for the root
+        self.color = color
+        self.flipped = flipped
+        self.children = []
+        self.child_visits = array('L')
+        self.child_wins = array('d')
+        self.child_priors = array('f') # Prior weight of each child, 0 unless a policy sets one
+        self.child_virtual = array('L') # Tree-parallel threads currently searching below each child
+        self.child_amaf_visits = array('L') # RAVE statistics of each child's move, see USE_RAVE
+        self.child_amaf_wins = array('d')
+        # Packed legal moves not yet expanded, generated on first expansion since most
+        # nodes are only ever simulated from
+        self._untried = None
+        self._untried_priors = None # With PUCT, priors of the untried moves, both sorted by ascending prior
+        self._visits = 0
+        self._wins = 0
+        if parent is None:
+            self.index = None
+            self.packed_state = bytes(state) if isinstance(state, (bytes, bytearray)) else bytes(encode_board(state))
+        else:
+            self.index = len(parent.children)
+            self.packed_state = None
+            # Statistics first, so a thread that already sees the child can read them
+            parent.child_visits.append(0)
+            parent.child_wins.append(0)
+            parent.child_priors.append(0)
+            parent.child_virtual.append(0)
+            parent.child_amaf_visits.append(0)
+            parent.child_amaf_wins.append(0)
+            parent.children.append(self)
+        if (zobrist_hash is None or kings is None) and not isinstance(state, list):
+            state = self.state
+        # Zobrist hash of the board with color to move, used to find the node again after a move
+        self.hash = zobrist_hash if zobrist_hash is not None else compute_zobrist_hash(state, color)
+        # The node's board never changes, so its kings are found once; pass them in when already known
+        kings = kings if kings is not None else ChessValidator(state, flipped).find_kings()
+        self.king_squares = _pack_kings(kings)
+
+    @property
+    def move(self):
+        """The move from the parent's board to this node's, None for the root"""
+        return unpack_move(self.code)
+
+    @property
+    def kings(self):
+        """(red, black) general squares, None for a captured general"""
+        return _unpack_kings(self.king_squares)
+
+    @property
+    def root(self):
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    @property
+    def visits(self):
+        return self._visits if self.parent is None else self.parent.child_visits[self.index]
+
+    @visits.setter
+    def visits(self, value):
+        if self.parent is None:
+            self._visits = value
+        else:
+            self.parent.child_visits[self.index] = value
+
+    @property
+    def wins(self):
+        return self._wins if self.parent is None else self.parent.child_wins[self.index]
+
+    @wins.setter
+    def wins(self, value):
+        if self.parent is None:
+            self._wins = value
+        else:
+            self.parent.child_wins[self.index] = value
+
+    @property
+    def untried(self):
+        """array('H') of packed legal moves not yet expanded into children"""
+        if self._untried is None:
+            self._untried = array('H', map(pack_move, self._get_valid_moves()))
+        return self._untried
+
+    @property
+    def untried_moves(self):
+        """Legal moves not yet expanded into children, as a new list of move tuples"""
+        return [unpack_move(code) for code in self.untried]
+
+    @property
+    def state(self):
+        """A fresh list-of-lists copy of this node's board, safe to modify"""
+        codes = []
+        node = self
+        while node.parent is not None:
+            codes.append(node.code)
+            node = node.parent
+        squares = bytearray(node.packed_state)
+        for code in reversed(codes):
+            squares[code & 0x7F] = squares[code >> 7]
+            squares[code >> 7] = 0
+        return decode_board(squares)
+
+    @property
+    def validator(self):
+        """A validator over a fresh copy of this node's board"""
+        kings = self.kings
+        validator = ChessValidator(self.state, self.flipped)
+        validator.track_kings({'red': kings[0], 'black': kings[1]})
+        return validator
+
+    def take_untried(self, index):
+        """Remove the untried move at index, return (packed move, prior or 0)"""
+        code = self.untried.pop(index)
+        prior = self._untried_priors.pop(index) if self._untried_priors is not None else 0
+        return code, prior
+
+    def rave_value(self, index, value, count, own_turn):
+        """
+        Blend value, the mean result of child index over count visits for the
+        side to move here, with the edge's AMAF mean (see RAVE_EQUIVALENCE).
+        """
+        amaf_visits = self.child_amaf_visits[index]
+        if not amaf_visits:
+            return value
+        amaf = self.child_amaf_wins[index] / amaf_visits
+        if not own_turn:
+            amaf = 1 - amaf
+        beta = math.sqrt(RAVE_EQUIVALENCE / (3 * count + RAVE_EQUIVALENCE))
+        return (1 - beta) * value + beta * amaf
+
+    def puct_child(self, exploration, own_turn, rave=False):
+        """
+        Child maximizing PUCT for the side to move here; own_turn says whether
+        that is the root player, whose view the wins are counted from.
+        """
+        visits, wins, priors, virtual = self.child_visits, self.child_wins, self.child_priors, self.child_virtual
+        scale = exploration * math.sqrt(max(self.visits, 1))
+        best_index, best_value = 0, float('-inf')
+        for index in range(len(self.children)):
+            child_visits = visits[index]
+            # Virtual losses count as visits worth nothing to the side to move
+            count = child_visits + virtual[index] * VIRTUAL_LOSS
+            if count:
+                value = (wins[index] if own_turn else child_visits - wins[index]) / count
+            else:
+                value = 0.5
+            if rave:
+                value = self.rave_value(index, value, count, own_turn)
+            value += scale * priors[index] / (1 + count)
+            if value > best_value:
+                best_index, best_value = index, value
+        return self.children[best_index]
+
+    def detach(self):
+        """Make this node a root, keeping its board, statistics and subtree"""
+        if self.parent is not None:
+            self.packed_state = bytes(encode_board(self.state))
+            self._visits, self._wins = self.visits, self.wins
+            self.parent = self.index = None
+            self.code = 0
+
+    def _get_valid_moves(self, color=None):
+        # Table-driven generation, then filter out moves that leave our king in check
+        return generate_moves(self.state, color or self.color, self.flipped, self.kings)
 
     # UCT Value calculation might need access to flipped status if heuristics depend on it.
-    def uct_value(self, exploration_constant, k=0.1):
+    def uct_value(self, exploration_constant, k=0.1, root_color=None, rave=False):
         """Calculate UCT value with a distance-based heuristic for AI moves."""
-        if self.visits == 0:
+        # Each tree-parallel thread below this node counts as a lost visit, steering the others elsewhere
+        parent, index = self.parent, self.index
+        visits = parent.child_visits[index] + parent.child_virtual[index] * VIRTUAL_LOSS
+        if visits == 0:
             return float('inf')
+        root_color = root_color or self.root.color
+        mean = parent.child_wins[index] / visits
+        if rave:
+            # Wins count from the root player's view here, as in the plain mean
+            mean = parent.rave_value(index, mean, visits, True)
         # Standard UCT formula
-        uct = (self.wins / self.visits) + exploration_constant * math.sqrt(math.log(self.parent.visits) / self.visits)
+        uct = mean + exploration_constant * math.sqrt(math.log(max(parent.visits, 1)) / visits)
         # Apply heuristic only for AI's moves
-        if self.parent and self.parent.color == self.root.color and self.move:  # Check parent exists
-            # Temporarily set validator to parent's state to find king pos before the move
-            original_board = self.validator.board
-            self.validator.board = self.parent.state # Use parent state for king pos before move
-            self.validator.flipped = self.root.validator.flipped # Ensure flipped status is correct
-
-            # Find opponent's king position
-            opponent_king_idx = 1 if self.root.color == 'red' else 0
-            kings = self.validator.find_kings()
-            opponent_king_pos = kings[opponent_king_idx] if len(kings) > opponent_king_idx else None
-
-            self.validator.board = original_board # Restore validator board
+        if self.parent and self.parent.color == root_color and self.code:  # Check parent exists
+            # Find opponent's king position in the parent's state (before the move)
+            opponent_king_idx = 1 if root_color == 'red' else 0
+            opponent_king_pos = self.parent.kings[opponent_king_idx]
 
             if opponent_king_pos:
                 from_pos, to_pos = self.move
@@ -808,40 +2377,79 @@ class MCTSNode:
 
 class MCTS:
 
-    def __init__(self, state, color, time_limit=1.0, exploration_constant=1.41, flipped=False, max_mate_depth=2):
-        self.root = MCTSNode(copy.deepcopy(state), color=color, flipped=flipped)
+    def __init__(self, state, color, time_limit=1.0, exploration_constant=1.41, flipped=False, max_mate_depth=2,
+                 backend=None, mate_table=None, search_table=None, ordering=None):
+        self.root = MCTSNode(encode_board(state), color=color, flipped=flipped)
         self.time_limit = time_limit
+        self.backend = backend # Validator backend for search positions and evaluation, see create_validator
+        self.rollout_mobility = ROLLOUT_MOBILITY # Cheap mobility for rollouts, root ranking stays exact
+        self.rollout_policy = ROLLOUT_POLICY # See ROLLOUT_POLICIES
+        self.use_pn_mate_search = True # Try find_mate_pn before the fixed-depth mate search
+        self.nodes = 0         # Search and quiescence nodes visited
+        self.deadline = None   # time.time() after which searches raise TimeoutError, None for no limit
         self.exploration_constant = exploration_constant
         self.max_mate_depth = max_mate_depth
-        self.untried_moves = self.root._get_valid_moves(color)  # Moves not yet expanded
-
+        self.workers = MCTS_WORKERS # Processes for root-parallel search, see MCTS_WORKERS
+        self.threads = MCTS_THREADS # Threads for tree-parallel search, see MCTS_THREADS
+        self.locks = None           # Striped locks while a tree-parallel search runs, else None
+        self.selection = SELECTION_POLICY # See SELECTION_POLICIES
+        self.rave = USE_RAVE        # Blend AMAF statistics into selection, see USE_RAVE
+        self.playouts_per_second = None # Rollout throughput of the last get_best_move search
+        self._set_root(self.root)
+
+        # Pass tables kept from earlier moves of the same game to reuse their results
+        self.mate_transposition_table = mate_table if mate_table is not None else TranspositionTable(MATE_TABLE_MB)
+        self.search_table = search_table if search_table is not None else TranspositionTable(TRANSPOSITION_TABLE_MB)
+        # Killer, history and countermove tables for the mate search, alpha-beta and MCTS priors
+        self.ordering = ordering if ordering is not None else MoveOrdering()
+
+    def _set_root(self, root):
+        """Make root the node get_best_move searches from"""
+        self.root = root
+
+        # Working copy of the root board for get_best_move, which tries moves on it in place
+        self.root_state = root.state
         # Ensure validator uses the flipped status from the root
-        self.validator = ChessValidator(self.root.state, self.root.validator.flipped)
+        self.validator = ChessValidator(self.root_state, root.flipped)
         self.forced_sequence = None  # To store the checkmate sequence
 
-        self.escape_positions_table = {}  # New table for caching opponent escape positions
+    def advance(self, state, color, moves=None):
+        """
+        Move the root to the position state (color to move) reached since the
+        last search, normally the grandchild for our move and the opponent's
+        reply, keeping its subtree and statistics and dropping the rest of the
+        tree. The node is found by following moves (the moves played since the
+        root) when given, otherwise by Zobrist hash among the children and
+        grandchildren. Starts a fresh tree if there is no such node or the
+        side the engine plays has changed. Returns True if a subtree was kept.
+        """
+        target_hash = compute_zobrist_hash(state, color)
+        node = None
+        if color == self.root.color:
+            if moves is not None:
+                node = self.root
+                for move in moves:
+                    node = next((child for child in node.children if child.move == move), None)
+                    if node is None:
+                        break
+                if node is not None and node.hash != target_hash:
+                    node = None
+            else:
+                candidates = [self.root] + [grandchild for child in self.root.children for grandchild in child.children]
+                node = next((candidate for candidate in candidates if candidate.hash == target_hash), None)
 
-        self.mate_transposition_table = {}
-        # Zobrist initialization
-        self.zobrist_table = {}
-        piece_types = ['R帥', 'R仕', 'R相', 'R馬', 'R車', 'R炮', 'R兵',
-                       'B將', 'B士', 'B象', 'B馬', 'B車', 'B炮', 'B卒']
-        for row in range(10):
-            for col in range(9):
-                for piece in piece_types:
-                    self.zobrist_table[(row, col, piece)] = random.getrandbits(64)
-        self.zobrist_side = {'red': random.getrandbits(64), 'black': random.getrandbits(64)}
+        if node is None:
+            self._set_root(MCTSNode(encode_board(state), color=color, flipped=self.root.flipped))
+            return False
 
+        # Detach the subtree so the old root and the siblings can be freed
+        node.detach()
+        self._set_root(node)
+        return True
 
-    def compute_zobrist_hash(self, board, color):
-        h = 0
-        for row in range(10):
-            for col in range(9):
-                piece = board[row][col]
-                if piece:
-                    h ^= self.zobrist_table[(row, col, piece)]
-        h ^= self.zobrist_side[color]
-        return h
+    def _new_position(self, board, color):
+        """Wrap board in a Position sharing this search's flipped status"""
+        return Position(board, color, self.root.flipped, self.backend)
 
     def calculate_attack_distance(self, validator, piece, start_pos, king_pos):
         """
@@ -866,132 +2474,402 @@ class MCTS:
                 continue
                 
             # Explore all possible moves from current_pos
-            for to_row in range(10):
-                for to_col in range(9):
-                    to_pos = (to_row, to_col)
-                    # Temporarily place piece at current_pos to check valid moves
-                    original_at_current = validator.board[current_pos[0]][current_pos[1]]
-                    validator.board[current_pos[0]][current_pos[1]] = piece
-                    if validator.is_valid_move(current_pos, to_pos):
-                        validator.board[current_pos[0]][current_pos[1]] = original_at_current
-                        if to_pos not in visited:
-                            visited.add(to_pos)
-                            # Check if from to_pos, the piece can attack the king
-                            original_at_to = validator.board[to_pos[0]][to_pos[1]]
-                            validator.board[to_pos[0]][to_pos[1]] = piece
-                            if validator.is_valid_move(to_pos, king_pos):
-                                validator.board[to_pos[0]][to_pos[1]] = original_at_to
-                                return dist + 1
-                            validator.board[to_pos[0]][to_pos[1]] = original_at_to
-                            queue.append((to_pos, dist + 1))
-                    else:
-                        validator.board[current_pos[0]][current_pos[1]] = original_at_current
+            # Temporarily place piece at current_pos to generate its moves
+            original_at_current = validator.board[current_pos[0]][current_pos[1]]
+            validator.board[current_pos[0]][current_pos[1]] = piece
+            targets = validator.generate_piece_targets(current_pos)
+            validator.board[current_pos[0]][current_pos[1]] = original_at_current
+            for to_pos in targets:
+                if to_pos not in visited:
+                    visited.add(to_pos)
+                    # Check if from to_pos, the piece can attack the king
+                    original_at_to = validator.board[to_pos[0]][to_pos[1]]
+                    validator.board[to_pos[0]][to_pos[1]] = piece
+                    if validator.is_valid_move(to_pos, king_pos):
+                        validator.board[to_pos[0]][to_pos[1]] = original_at_to
+                        return dist + 1
+                    validator.board[to_pos[0]][to_pos[1]] = original_at_to
+                    queue.append((to_pos, dist + 1))
         return 3  # Distance > 2
 
     def select_node(self):
-        """Select a node to expand using UCT"""
+        """Select a node to expand using UCT or PUCT (see SELECTION_POLICIES)"""
         node = self.root
-        while node.untried_moves == [] and node.children:
-            node = max(node.children, key=lambda n: n.uct_value(self.exploration_constant))
+        root_color = node.color
+        locks = self.locks
+        puct = self.selection == 'puct'
+        rave = self.rave
+        # A node with children generated its moves when first expanded, so this never generates them
+        while node.children and not (node.untried and len(node.children) < self._widening_limit(node)):
+            if puct:
+                child = node.puct_child(PUCT_EXPLORATION, node.color == root_color, rave)
+            else:
+                child = max(node.children, key=lambda n: n.uct_value(self.exploration_constant, root_color=root_color,
+                                                                     rave=rave))
+            if locks is not None:
+                with locks[node.hash % LOCK_STRIPES]:
+                    node.child_virtual[child.index] += 1
+            node = child
         return node
 
+    def _widening_limit(self, node):
+        """Children node may have before the next untried move is added"""
+        if self.selection != 'puct':
+            return float('inf')
+        return WIDENING_CONSTANT * (node.visits + 1) ** WIDENING_EXPONENT
+
+    def _edge_priors(self, node, moves):
+        """Prior probability of each of node's moves from cheap features, see PRIOR_CHECK_BONUS"""
+        position = self._new_position(node.state, node.color)
+        board = position.board
+        enemy_king = node.kings[1 if node.color == 'red' else 0]
+        ordering = self.ordering
+        countermove = ordering.countermoves[node.code] if node.code else None
+        scores = []
+        for move in moves:
+            (from_row, from_col), (to_row, to_col) = move
+            piece = board[from_row][from_col]
+            captured = board[to_row][to_col]
+            score = PIECE_VALUES[captured[1]] if captured else 0
+            score += (piece_pst_score(piece, to_row, to_col, node.flipped) -
+                      piece_pst_score(piece, from_row, from_col, node.flipped))
+            if enemy_king:
+                king_row, king_col = enemy_king
+                steps = (abs(from_row - king_row) + abs(from_col - king_col) -
+                         abs(to_row - king_row) - abs(to_col - king_col))
+                score += PRIOR_KING_STEP_BONUS * steps
+            if self._gives_check(position, move):
+                score += PRIOR_CHECK_BONUS
+            score += PRIOR_HISTORY_BONUS * ordering.history_share(move)
+            if countermove == pack_move(move):
+                score += PRIOR_HISTORY_BONUS
+            scores.append(score / PRIOR_TEMPERATURE)
+        top = max(scores, default=0)
+        weights = [math.exp(score - top) for score in scores]
+        total = sum(weights)
+        return [weight / total for weight in weights]
+
+    def _rank_untried(self, node):
+        """With PUCT, sort node's untried moves by prior (once) so the best is last"""
+        if self.selection == 'puct' and node._untried_priors is None:
+            ranked = sorted(zip(self._edge_priors(node, [unpack_move(code) for code in node.untried]), node.untried))
+            node._untried = array('H', (code for _, code in ranked))
+            node._untried_priors = array('f', (prior for prior, _ in ranked))
+
     def expand_node(self, node):
         """Expand the node by adding a child with a promising move."""
-        if not node.untried_moves:
+        if self.locks is not None:
+            with self.locks[node.hash % LOCK_STRIPES]:
+                child = self._expand_node(node)
+                if child is not node:
+                    node.child_virtual[child.index] += 1
+            return child
+        return self._expand_node(node)
+
+    def _expand_node(self, node):
+        untried = node.untried
+        if not untried:
             return node
+        if self.selection == 'puct':
+            # Admit the moves best prior first
+            self._rank_untried(node)
+            code, prior = node.take_untried(len(node._untried) - 1)
+            child = self._add_child(node, code)
+            node.child_priors[child.index] = prior
+            return child
         if node.color == self.root.color:  # AI's turn
             # Find opponent's king position in current node's state
-            original_board = self.validator.board
-            self.validator.board = node.state
             opponent_king_idx = 1 if node.color == 'red' else 0
-            opponent_king_pos = self.validator.find_kings()[opponent_king_idx]
-            self.validator.board = original_board
+            opponent_king_pos = node.kings[opponent_king_idx]
             if opponent_king_pos:
                 # Choose move that minimizes distance to opponent's king
-                best_move = min(
-                    node.untried_moves,
-                    key=lambda m: abs(m[1][0] - opponent_king_pos[0]) + abs(m[1][1] - opponent_king_pos[1])
-                )
+                king_row, king_col = opponent_king_pos
+                index = min(range(len(untried)), key=lambda i: abs(SQUARE_LIST[untried[i] & 0x7F][0] - king_row) +
+                                                               abs(SQUARE_LIST[untried[i] & 0x7F][1] - king_col))
             else:
-                best_move = random.choice(node.untried_moves)
+                index = random.randrange(len(untried))
         else:
             # For opponent's turn, select randomly
-            best_move = random.choice(node.untried_moves)
-        node.untried_moves.remove(best_move)
-        # Create new state by applying the move
-        new_state = copy.deepcopy(node.state)
-        from_pos, to_pos = best_move
-        new_state[to_pos[0]][to_pos[1]] = new_state[from_pos[0]][from_pos[1]]
-        new_state[from_pos[0]][from_pos[1]] = None
+            index = random.randrange(len(untried))
+        return self._add_child(node, node.take_untried(index)[0])
+
+    def _add_child(self, node, code):
+        """Create the child of node for the packed move code, which the caller took out of node.untried"""
+        move = unpack_move(code)
+        # Apply the move to a copy of the node's board to get the child's hash and kings
+        position = self._new_position(node.state, node.color)
+        position.make_move(move)
         # Child node has opponent's color
         child_color = 'red' if node.color == 'black' else 'black'
-        child = MCTSNode(new_state, parent=node, move=best_move, color=child_color, flipped=node.validator.flipped)
-        node.children.append(child)
-        return child
+        return MCTSNode(None, parent=node, move=move, color=child_color, flipped=node.flipped,
+                        zobrist_hash=position.hash, kings=(position.kings['red'], position.kings['black']))
+
+    def run_playouts(self, seconds):
+        """Run select/expand/simulate/backpropagate for seconds, return the number of playouts"""
+        playouts = 0
+        start_time = time.time()
+        while time.time() - start_time < seconds:
+            node = self.select_node()
+            node = self.expand_node(node)
+            # With RAVE the rollout reports the moves it played for the AMAF statistics
+            played = [] if self.rave else None
+            result = self.simulate(node, played)
+            self.backpropagate(node, result, played)
+            playouts += 1
+        return playouts
+
+    def run_tree_parallel(self, seconds, threads=None):
+        """
+        Tree-parallel search: threads run playouts on this tree together for
+        seconds, kept on different paths by virtual loss. Returns the total
+        number of playouts.
+        """
+        threads = threads or self.threads
+        if getattr(sys, '_is_gil_enabled', lambda: True)():
+            print('Tree-parallel search on a GIL build, the threads will share one core')
+        counts = [0] * threads
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
 
-    def simulate(self, node):
-        """Enhanced simulation with better strategic play"""
-        state = copy.deepcopy(node.state)
+        def search(slot):
+            counts[slot] = self.run_playouts(seconds)
+
+        workers = [threading.Thread(target=search, args=(slot,), daemon=True) for slot in range(threads)]
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            self.locks = None
+        return sum(counts)
+
+    def run_root_parallel(self, seconds, workers=None):
+        """
+        Root-parallel search: workers processes each grow an independent tree
+        from the root for seconds with its own seed, then their root-child
+        statistics (visits, wins and AMAF) are added to this tree's root
+        children. Falls back to searching in this process if no pool can be
+        started. Returns the total number of playouts.
+        """
+        workers = workers or self.workers
+        jobs = [(self.root.state, self.root.color, self.root.flipped, seconds, random.getrandbits(32), self.backend,
+                 self.exploration_constant, self.rollout_policy, self.rollout_mobility, self.selection,
+                 self.rave)
+                for _ in range(workers)]
+        try:
+            with multiprocessing.get_context().Pool(workers) as pool:
+                results = pool.map(_mcts_worker, jobs)
+        except OSError as e:
+            print(f'Root-parallel search unavailable ({e}), searching in one process')
+            return self.run_playouts(seconds)
+
+        root = self.root
+        self._rank_untried(root)
+        children = {child.code: child for child in root.children}
+        playouts = 0
+        for worker_playouts, stats in results:
+            playouts += worker_playouts
+            for code, visits, wins, amaf_visits, amaf_wins in stats:
+                child = children.get(code)
+                if child is None:
+                    code, prior = root.take_untried(root.untried.index(code))
+                    child = children[code] = self._add_child(root, code)
+                    root.child_priors[child.index] = prior
+                child.visits += visits
+                child.wins += wins
+                root.child_amaf_visits[child.index] += amaf_visits
+                root.child_amaf_wins[child.index] += amaf_wins
+                root.visits += visits
+                root.wins += wins
+        return playouts
+
+    def simulate(self, node, played=None):
+        """
+        Enhanced simulation with better strategic play. If played is a list,
+        the packed moves of the rollout are appended to it.
+        """
+        if self.rollout_policy == 'quiescence':
+            return self._quiescence_rollout(node)
+        if self.rollout_policy == 'random':
+            return self._random_rollout(node, ROLLOUT_MAX_PLIES, False, played)
+        if self.rollout_policy == 'capture':
+            return self._random_rollout(node, ROLLOUT_MAX_PLIES, True, played)
+        if self.rollout_policy == 'truncated':
+            return self._random_rollout(node, ROLLOUT_TRUNCATE_PLIES, False, played)
+        position = self._new_position(node.state, node.color)
+        state = position.board
+        validator = position.validator
         color = node.color
         moves_count = 0
-        max_moves = 50
+        max_moves = ROLLOUT_MAX_PLIES
         
-        validator = ChessValidator(state, node.validator.flipped)
         while moves_count < max_moves:
             moves = []
             best_move_score = float('-inf')
             best_moves = []
+            opponent_color = 'red' if color == 'black' else 'black'
             
-            # Get all valid moves and score them
-            for row in range(10):
-                for col in range(9):
-                    piece = state[row][col]
-                    if piece and piece[0] == color[0].upper():
-                        for to_row in range(10):
-                            for to_col in range(9):
-                                if validator.is_valid_move((row, col), (to_row, to_col)):
-                                    test_state = copy.deepcopy(state)
-                                    test_state[to_row][to_col] = test_state[row][col]
-                                    test_state[row][col] = None
-                                    validator.board = test_state
-                                    
-                                    if not validator.is_in_check(color):
-                                        move_score = 0
-                                        # Prioritize checks and captures
-                                        if validator.is_in_check('red' if color == 'black' else 'black'):
-                                            move_score += 100
-                                        if state[to_row][to_col]:  # Capture
-                                            move_score += 50
-                                        
-                                        moves.append(((row, col), (to_row, to_col)))
-                                        if move_score > best_move_score:
-                                            best_move_score = move_score
-                                            best_moves = [((row, col), (to_row, to_col))]
-                                        elif move_score == best_move_score:
-                                            best_moves.append(((row, col), (to_row, to_col)))
-                                    
-                                    validator.board = state
+            # Get all valid moves and score them, trying each one in place
+            for move in list(validator.generate_pseudo_legal_moves(color)):
+                exchange = validator.static_exchange(*move)
+                token = position.make_move(move)
+
+                if not validator.is_in_check(color):
+                    move_score = 0
+                    # Prioritize checks and captures that don't lose material
+                    if validator.is_in_check(opponent_color):
+                        move_score += 100
+                    if token[2] and exchange >= 0:  # Capture
+                        move_score += 50
+
+                    moves.append(move)
+                    if move_score > best_move_score:
+                        best_move_score = move_score
+                        best_moves = [move]
+                    elif move_score == best_move_score:
+                        best_moves.append(move)
+
+                position.unmake_move(token)
             
             if not moves:
                 return color != self.root.color
             
             # Choose from best moves with higher probability
             if best_moves and random.random() < 0.8:
-                from_pos, to_pos = random.choice(best_moves)
+                move = random.choice(best_moves)
             else:
-                from_pos, to_pos = random.choice(moves)
+                move = random.choice(moves)
             
-            state[to_pos[0]][to_pos[1]] = state[from_pos[0]][from_pos[1]]
-            state[from_pos[0]][from_pos[1]] = None
-            validator.board = state
+            position.make_move(move)
+            if played is not None:
+                played.append(pack_move(move))
             
             if validator.is_checkmate(color):
                 return color == self.root.color
             
-            color = 'red' if color == 'black' else 'black'
+            color = opponent_color
             moves_count += 1
         
-        score = self._evaluate_position(state, self.root.color)
+        score = self._evaluate_position(state, self.root.color, self.rollout_mobility)
+        return self._score_to_result(score)
+
+    def _random_rollout(self, node, max_plies, captures_first, played=None):
+        """
+        Play up to max_plies random moves from node and score the result. Each
+        ply draws from the pseudo-legal moves and tests only the drawn move for
+        legality, drawing again if it leaves the mover in check; with
+        captures_first, captures are drawn before quiet moves. A side left
+        without a legal move loses.
+        """
+        position = self._new_position(node.state, node.color)
+        board = position.board
+        validator = position.validator
+        for _ in range(max_plies):
+            color = position.color
+            moves = list(validator.generate_pseudo_legal_moves(color))
+            if captures_first:
+                pools = [[move for move in moves if board[move[1][0]][move[1][1]]],
+                         [move for move in moves if not board[move[1][0]][move[1][1]]]]
+            else:
+                pools = [moves]
+            moved = False
+            for pool in pools:
+                while pool and not moved:
+                    index = random.randrange(len(pool))
+                    token = position.make_move(pool[index])
+                    if not validator.is_in_check(color):
+                        moved = True
+                        break
+                    position.unmake_move(token)
+                    pool[index] = pool[-1]
+                    pool.pop()
+                if moved:
+                    break
+            if not moved:
+                return color != self.root.color
+            if played is not None:
+                played.append(pack_move(pool[index]))
+        score = self._evaluate_position(board, self.root.color, self.rollout_mobility)
+        return self._score_to_result(score)
+
+    def quiescence(self, position, alpha=-MATE_SCORE - 1, beta=MATE_SCORE + 1, ply=0):
+        """
+        Score position for the side to move once captures (and, for the first
+        QUIESCENCE_CHECK_PLIES, checks) have been played out, so hanging pieces
+        don't distort the static score. The full evaluation runs once, here;
+        deeper nodes shift it by the material swing. ply is the distance from
+        the search root and only matters for mate scores.
+        """
+        root_color = position.color
+        offset = self._leaf_score(position) - _material_balance(position, root_color)
+        return self._quiescence(position, alpha, beta, ply, 0, root_color, offset)
+
+    def _quiescence(self, position, alpha, beta, ply, qply, root_color, offset):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 15 == 0 and time.time() > self.deadline:
+            raise TimeoutError("Quiescence search timeout")
+
+        balance = offset + _material_balance(position, root_color)
+        stand_pat = balance if position.color == root_color else -balance
+        if qply >= QUIESCENCE_MAX_PLY:
+            return stand_pat
+
+        moves = position.legal_moves()
+        if not moves:
+            return -MATE_SCORE + ply
+        board = position.board
+
+        if position.is_in_check():
+            best_score = -MATE_SCORE - 1 # Every evasion is searched, no standing pat
+            candidates = sorted(moves, key=lambda move: -_mvv_lva_score(board, move))
+        else:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            best_score = stand_pat
+            captures = [move for move in moves if board[move[1][0]][move[1][1]]]
+            captures.sort(key=lambda move: -_mvv_lva_score(board, move))
+            candidates = [move for move in captures
+                          if stand_pat + PIECE_VALUES[board[move[1][0]][move[1][1]][1]] + QUIESCENCE_DELTA > alpha
+                          and position.validator.static_exchange(*move) >= 0]
+            if qply < QUIESCENCE_CHECK_PLIES:
+                candidates += [move for move in moves
+                               if not board[move[1][0]][move[1][1]] and self._gives_check(position, move)]
+
+        for move in candidates:
+            token = position.make_move(move)
+            try:
+                score = -self._quiescence(position, -beta, -alpha, ply + 1, qply + 1, root_color, offset)
+            finally:
+                position.unmake_move(token)
+            if score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        return best_score
+
+    def _gives_check(self, position, move):
+        token = position.make_move(move)
+        check = position.validator.is_in_check(position.color)
+        position.unmake_move(token)
+        return check
+
+    def _leaf_score(self, position):
+        """Static score of position for the side to move"""
+        return self._evaluate_position(position.board, position.color, self.rollout_mobility)
+
+    def _quiescence_rollout(self, node):
+        """Rollout policy that replaces the playout with a quiescence search from node"""
+        position = self._new_position(node.state, node.color)
+        score = self.quiescence(position)
+        if node.color != self.root.color:
+            score = -score
+        return self._score_to_result(score)
+
+    def _score_to_result(self, score):
+        """Map an evaluation from the root player's side to a rollout result in [0, 1]"""
         if score > 1000:  # Clear winning position
             return 1.0
         elif score < -1000:  # Clear losing position
@@ -999,29 +2877,97 @@ class MCTS:
         else:  # Convert score to probability between 0 and 1
             return (score + 5000) / 10000.0
 
-    def backpropagate(self, node, result):
-        """Backpropagate the result through the tree"""
+    def backpropagate(self, node, result, played=None):
+        """
+        Backpropagate the result through the tree. played, the packed moves of
+        the rollout from node, also updates the AMAF statistics of every edge
+        whose move the side to move made later in the simulation.
+        """
+        locks = self.locks
+        # Moves each side made below the current node, tree and rollout, for the AMAF update
+        later = None
+        if played is not None:
+            later = {node.color: set(played[0::2]), ('red' if node.color == 'black' else 'black'): set(played[1::2])}
+        if locks is not None:
+            # Tree-parallel: also take back the virtual loss select_node and expand_node added
+            while node.parent is not None:
+                parent, index = node.parent, node.index
+                with locks[parent.hash % LOCK_STRIPES]:
+                    parent.child_visits[index] += 1
+                    parent.child_wins[index] += result
+                    parent.child_virtual[index] -= 1
+                    if later is not None:
+                        self._update_amaf(parent, later, node.code, result)
+                node = parent
+            with locks[node.hash % LOCK_STRIPES]:
+                node.visits += 1
+                node.wins += result
+            return
         while node:
             node.visits += 1
             node.wins += result
+            if later is not None and node.parent is not None:
+                self._update_amaf(node.parent, later, node.code, result)
             node = node.parent
 
+    def _update_amaf(self, node, later, code, result):
+        """Credit result to node's edges whose move its side to move made later, after adding code to those moves"""
+        moves = later[node.color]
+        moves.add(code)
+        amaf_visits, amaf_wins = node.child_amaf_visits, node.child_amaf_wins
+        for index, child in enumerate(node.children):
+            if child.code in moves:
+                amaf_visits[index] += 1
+                amaf_wins[index] += result
+
     def find_mate_in_n(self, board, color, n, start_time, time_limit):
+        """Search for a forced mate in n moves for color. The board passed in is not modified."""
+        position = self._new_position([row[:] for row in board], color)
+        return self._find_mate_in_n(position, n, start_time, time_limit, 0)
+
+    def find_mate_pn(self, board, color, node_budget=PN_NODE_BUDGET, memory_mb=PN_TABLE_MB, deadline=None):
+        """
+        Proof-number search for a forced mate by color through checks, see
+        ProofNumberSearch. Returns the mating side's moves in the same format
+        as find_mate_in_n, or None if no mate was proven. The board passed in
+        is not modified.
+        """
+        position = self._new_position([row[:] for row in board], color)
+        solver = ProofNumberSearch(position, node_budget, memory_mb, deadline)
+        result = solver.solve()
+        print(f'Proof-number mate search: {result} after {solver.nodes} nodes')
+        if result != 'proven':
+            return None
+        return solver.mating_line()
+
+    def _find_mate_in_n(self, position, n, start_time, time_limit, ply=0, previous=None):
         if time.time() - start_time > time_limit:
             raise TimeoutError("Checkmate search timeout")
         
-        # Check transposition table
-        h = self.compute_zobrist_hash(board, color)
-        key = (h, n)
-        if key in self.mate_transposition_table:
-            return self.mate_transposition_table[key]
-        
+        # Check transposition table: a mate within fewer moves is also a mate in n,
+        # no mate within more moves rules out a mate in n
+        key = position.hash
+        entry = self.mate_transposition_table.probe(key)
+        if entry:
+            depth, flag, _, move = entry
+            if flag == TT_LOWER and depth <= n:
+                # Only the first move is stored, the rest of the line is rebuilt from it
+                line = self._stored_mate_line(position, move, depth, start_time, time_limit, ply)
+                if line:
+                    return line
+            if flag == TT_UPPER and depth >= n:
+                return None
+        
+        color = position.color
         opponent_color = 'red' if color == 'black' else 'black'
         if n < 1:
             return None
         
-        temp_node = MCTSNode(board, color=color, flipped=self.root.validator.flipped)
-        moves = temp_node._get_valid_moves(color)
+        validator = position.validator
+        moves = position.legal_moves(color)
+        # Only moves that can give check are tested for it (see check_candidates); every
+        # move is still played, since leaving the opponent no move at all also wins
+        could_check = validator.check_candidates(color)
         
         # Prioritize AI moves (existing logic)
         checking_moves = []
@@ -1030,105 +2976,115 @@ class MCTS:
         for move in moves:
             if time.time() - start_time > time_limit:
                 raise TimeoutError("Checkmate search timeout")
-            from_pos, to_pos = move
-            new_board = copy.deepcopy(board)
-            piece = new_board[from_pos[0]][from_pos[1]]
-            new_board[to_pos[0]][to_pos[1]] = piece
-            new_board[from_pos[0]][from_pos[1]] = None
-            self.validator.board = new_board
-
-            if self.validator.is_checkmate(opponent_color):
-                self.mate_transposition_table[key] = [move]
+            # check_candidates reads the board before the move (the moving piece's type)
+            maybe_check = could_check is not None and could_check(*move)
+            token = position.make_move(move)
+
+            if validator.is_checkmate(opponent_color):
+                position.unmake_move(token)
+                self.mate_transposition_table.store(key, 1, TT_LOWER, MATE_SCORE, move)
+                if not token[2]:
+                    self.ordering.record_cutoff(move, 1, ply, previous)
                 return [move]
 
-            if self.validator.is_in_check(opponent_color):
+            if maybe_check and validator.is_in_check(opponent_color):
                 checking_moves.append(move)
-
-            elif board[to_pos[0]][to_pos[1]]:
+            elif token[2]:
                 capturing_moves.append(move)
             else:
                 other_moves.append(move)
+            position.unmake_move(token)
         
+        # Captures that win the most material first, checks and quiet moves by the ordering tables
+        capturing_moves.sort(key=lambda move: -validator.static_exchange(*move))
+        checking_moves = self.ordering.order_quiet(checking_moves, ply, previous)
+        other_moves = self.ordering.order_quiet(other_moves, ply, previous)
         priority_moves = checking_moves + capturing_moves + other_moves
         
         if n == 1:
-            self.mate_transposition_table[key] = None
+            self.mate_transposition_table.store(key, 1, TT_UPPER, 0)
             return None
         
         for move in priority_moves:
             if time.time() - start_time > time_limit:
                 raise TimeoutError("Checkmate search timeout")
             
-            new_board = copy.deepcopy(board)
-            from_pos, to_pos = move
-            new_board[to_pos[0]][to_pos[1]] = new_board[from_pos[0]][from_pos[1]]
-            new_board[from_pos[0]][from_pos[1]] = None
-            
-            # Create opponent node and check if in check
-            opp_temp_node = MCTSNode(new_board, color=opponent_color, flipped=self.root.validator.flipped)
-            self.validator.board = new_board
-            in_check = self.validator.is_in_check(opponent_color)
+            token = position.make_move(move)
+            in_check = validator.is_in_check(opponent_color)
             
             # Get prioritized opponent moves
-            opponent_moves = self._get_prioritized_opponent_moves(opp_temp_node, opponent_color, in_check)
+            opponent_moves = self._get_prioritized_opponent_moves(position, opponent_color, in_check, ply + 1, move)
             
             all_lead_to_mate = True
             for opp_move in opponent_moves:
                 if time.time() - start_time > time_limit:
                     raise TimeoutError("Checkmate search timeout")
                 
-                opp_board = copy.deepcopy(new_board)
-                opp_from, opp_to = opp_move
-                opp_board[opp_to[0]][opp_to[1]] = opp_board[opp_from[0]][opp_from[1]]
-                opp_board[opp_from[0]][opp_from[1]] = None
-                
-                mate_sequence = self.find_mate_in_n(opp_board, color, n - 1, start_time, time_limit)
+                opp_token = position.make_move(opp_move)
+                mate_sequence = self._find_mate_in_n(position, n - 1, start_time, time_limit, ply + 2, opp_move)
+                position.unmake_move(opp_token)
                 if mate_sequence is None:
+                    # A refutation, try it early against the next mating attempts
+                    if not opp_token[2]:
+                        self.ordering.record_cutoff(opp_move, n, ply + 1, move)
                     all_lead_to_mate = False
                     break
             
+            position.unmake_move(token)
             if all_lead_to_mate and opponent_moves:
                 result = [move] + mate_sequence
-                self.mate_transposition_table[key] = result
+                self.mate_transposition_table.store(key, n, TT_LOWER, MATE_SCORE, move)
+                if not token[2]:
+                    self.ordering.record_cutoff(move, n, ply, previous)
                 return result
         
-        self.mate_transposition_table[key] = None
+        self.mate_transposition_table.store(key, n, TT_UPPER, 0)
         return None
 
-    def _get_prioritized_opponent_moves(self, node, opponent_color, in_check):
+    def _stored_mate_line(self, position, move, depth, start_time, time_limit, ply):
         """
-        Generate a prioritized list of opponent moves.
-        If in check, prioritize moves that escape check.
-        Otherwise, prioritize capturing and defensive moves.
+        Full line of the mate in depth the table credits to move: play it,
+        answer with the reply the full search keeps (its last prioritized one)
+        and find the rest, through the table again where it can. None if the
+        entry doesn't hold up (a hash collision).
         """
-        all_moves = node._get_valid_moves(opponent_color)
-        
-        if in_check:
-            # Prioritize moves that escape check
-            escaping_moves = []
-            for move in all_moves:
-                from_pos, to_pos = move
-                piece = node.state[from_pos[0]][from_pos[1]]
-                # Simulate the move
-                test_board = copy.deepcopy(node.state)
-                test_board[to_pos[0]][to_pos[1]] = piece
-                test_board[from_pos[0]][from_pos[1]] = None
-                self.validator.board = test_board
-                if not self.validator.is_in_check(opponent_color):
-                    escaping_moves.append(move)
-            # Return escaping moves first, followed by others (though typically only escaping moves are legal)
-            return escaping_moves + [m for m in all_moves if m not in escaping_moves]
-        else:
-            # Prioritize capturing moves, then others
-            capturing_moves = []
-            other_moves = []
-            for move in all_moves:
-                from_pos, to_pos = move
-                if node.state[to_pos[0]][to_pos[1]]:  # Capture
-                    capturing_moves.append(move)
-                else:
-                    other_moves.append(move)
-            return capturing_moves + other_moves
+        if move not in position.legal_moves():
+            return None
+        token = position.make_move(move)
+        opponent_color = position.color
+        line = None
+        if position.validator.is_checkmate(opponent_color):
+            line = [move]
+        elif depth > 1:
+            in_check = position.validator.is_in_check(opponent_color)
+            reply = self._get_prioritized_opponent_moves(position, opponent_color, in_check, ply + 1, move)[-1]
+            reply_token = position.make_move(reply)
+            rest = self._find_mate_in_n(position, depth - 1, start_time, time_limit, ply + 2, reply)
+            position.unmake_move(reply_token)
+            if rest:
+                line = [move] + rest
+        position.unmake_move(token)
+        return line
+
+    def _get_prioritized_opponent_moves(self, position, opponent_color, in_check, ply=None, previous=None):
+        """
+        Generate a prioritized list of opponent moves: captures with the best
+        exchange first, since they refute a mating attempt soonest, then quiet
+        moves by the ordering tables. When in check every legal move already
+        escapes it, so the order is the same.
+        """
+        all_moves = position.legal_moves(opponent_color)
+        board = position.board
+        capturing_moves = []
+        other_moves = []
+        for move in all_moves:
+            from_pos, to_pos = move
+            if board[to_pos[0]][to_pos[1]]:  # Capture
+                capturing_moves.append(move)
+            else:
+                other_moves.append(move)
+        capturing_moves.sort(key=lambda move: -position.validator.static_exchange(*move))
+        return capturing_moves + self.ordering.order_quiet(other_moves, ply, previous)
 
     def pieces_near_king(self, board, ai_color, validator):
         """
@@ -1160,8 +3116,8 @@ class MCTS:
         
         overall_start_time = time.time()
         
-        self.mate_transposition_table.clear()
-        self.escape_positions_table.clear()  # Add this
+        self.mate_transposition_table.new_search()
+        self.ordering.new_search()
         
         # When in check, find best escape move with time limit
         if self.validator.is_in_check(self.root.color):
@@ -1169,32 +3125,25 @@ class MCTS:
             check_escape_start = time.time()
 
             moves = []
+            # Moves are tried in place on the root state and always taken back
+            position = self._new_position(self.root_state, self.root.color)
             try:
-                for row in range(10):
-                    for col in range(9):
-                        # Check time limit for check escape search
-                        if time.time() - check_escape_start > CHECK_ESCAPE_TIME_LIMIT:
-                            raise TimeoutError("Check escape search timeout")
-                            
-                        piece = self.root.state[row][col]
-                        if piece and piece[0] == self.root.color[0].upper():
-                            for to_row in range(10):
-                                for to_col in range(9):
-                                    if self.validator.is_valid_move((row, col), (to_row, to_col)):
-                                        # Try the move
-                                        original_piece = self.root.state[to_row][to_col]
-                                        self.root.state[to_row][to_col] = piece
-                                        self.root.state[row][col] = None
-                                        
-                                        # Check if move escapes check
-                                        if not self.validator.is_in_check(self.root.color):
-                                            # Score the move using _evaluate_position
-                                            position_score = self._evaluate_position(self.root.state, self.root.color)
-                                            moves.append(((row, col), (to_row, to_col), position_score))
-                                        
-                                        # Undo the move
-                                        self.root.state[row][col] = piece
-                                        self.root.state[to_row][to_col] = original_piece
+                for move in list(position.validator.generate_pseudo_legal_moves(self.root.color)):
+                    # Check time limit for check escape search
+                    if time.time() - check_escape_start > CHECK_ESCAPE_TIME_LIMIT:
+                        raise TimeoutError("Check escape search timeout")
+
+                    # Try the move
+                    token = position.make_move(move)
+
+                    # Check if move escapes check
+                    if not position.validator.is_in_check(self.root.color):
+                        # Score the move using _evaluate_position
+                        position_score = self._evaluate_position(self.root_state, self.root.color)
+                        moves.append((move[0], move[1], position_score))
+
+                    # Undo the move
+                    position.unmake_move(token)
 
                 # If there are legal moves to escape check
                 if moves:
@@ -1214,7 +3163,7 @@ class MCTS:
         is_major_piece = False
         for r in range(10):
             for c in range(9):
-                piece = self.root.state[r][c]
+                piece = self.root_state[r][c]
                 if piece and piece[0] == self.root.color[0].upper():
                     piece_type = piece[1]
                     # For Chinese chess, all pieces except advisors and elephants can cross river
@@ -1228,13 +3177,20 @@ class MCTS:
             
             try:
                 # Check for mate in 1 - explicitly pass start time
-                mate_in_one = self.find_mate_in_n(self.root.state, self.root.color, 1, checkmate_search_start, CHECKMATE_TIME_LIMIT)
+                mate_in_one = self.find_mate_in_n(self.root_state, self.root.color, 1, checkmate_search_start, CHECKMATE_TIME_LIMIT)
                 if mate_in_one:
                     return mate_in_one[0]
 
                 # Check for mate in n if pieces are near opponent's king
-                if self.pieces_near_king(self.root.state, self.root.color, self.validator):
+                if self.pieces_near_king(self.root_state, self.root.color, self.validator):
                     print()
+                    # Long forced mates by checks first, then the fixed-depth search over all moves
+                    if self.use_pn_mate_search:
+                        mate_line = self.find_mate_pn(self.root_state, self.root.color,
+                                                      deadline=checkmate_search_start + CHECKMATE_TIME_LIMIT)
+                        if mate_line:
+                            self.forced_sequence = mate_line[1:]
+                            return mate_line[0]
                     for n in range(2, self.max_mate_depth + 1):
                         print(f'Checking for mate in {n}')
                         # Check both local and overall time limits
@@ -1243,7 +3199,7 @@ class MCTS:
                             current_time - overall_start_time > TOTAL_TIME_LIMIT):
                             raise TimeoutError("Time limit exceeded")
                             
-                        mate_in_n = self.find_mate_in_n(self.root.state, self.root.color, n, 
+                        mate_in_n = self.find_mate_in_n(self.root_state, self.root.color, n, 
                                                        checkmate_search_start, CHECKMATE_TIME_LIMIT)
                         if mate_in_n:
                             self.forced_sequence = mate_in_n[1:]
@@ -1265,80 +3221,84 @@ class MCTS:
             return None
 
         # Adjust MCTS search time limit to remaining time
-        mcts_start_time = time.time()
-        while time.time() - mcts_start_time < remaining_time:
-            node = self.select_node()
-            node = self.expand_node(node)
-            result = self.simulate(node)
-            self.backpropagate(node, result)
+        if self.workers > 1:
+            playouts = self.run_root_parallel(remaining_time)
+        elif self.threads > 1:
+            playouts = self.run_tree_parallel(remaining_time)
+        else:
+            playouts = self.run_playouts(remaining_time)
+        self.playouts_per_second = playouts / max(remaining_time, 1e-9)
+        print(f'playouts: {playouts} ({self.playouts_per_second:.1f}/s with {self.rollout_policy} rollouts)')
 
         if not self.root.children:
             return None
         return max(self.root.children, key=lambda n: n.visits).move
 
-    def _evaluate_position(self, state, ai_color):
+    def _material_pst_scores(self, states, ai_color=None):
+        """
+        (material, pst) per state, vectorized over all states when NumPy is
+        available. States may be boards or packed squares. Scores are from
+        Red's perspective, or ai_color's if given.
+        """
+        flipped = self.root.flipped
+        if np is not None:
+            material, pst = evaluate_material_pst_batch(board_planes(states), flipped)
+            scores = zip(material.tolist(), pst.tolist())
+        else:
+            scores = []
+            for state in states:
+                if isinstance(state, (bytes, bytearray)):
+                    state = decode_board(state)
+                scores.append(_material_pst_scores(state, flipped, _determine_game_phase(state)))
+        sign = -1 if ai_color == 'black' else 1
+        return [(sign * material, sign * pst) for material, pst in scores]
+
+    def _evaluate_position(self, state, ai_color, mobility='exact'):
         """
         Sophisticated position evaluation function for Xiangqi.
         Evaluates material, piece positions (PST), mobility, king safety, and structure.
+        mobility picks how moves are counted, see MOBILITY_MODES.
         Returns score from the perspective of ai_color (positive is good for ai_color).
         """
         total_score = 0
         opponent_color = 'black' if ai_color == 'red' else 'red'
-        board_flipped = self.root.validator.flipped # Use flipped status from the root node
+        board_flipped = self.root.flipped # Use flipped status from the root node
 
         # Use a temporary validator for this specific state evaluation
-        validator = ChessValidator(state, board_flipped)
+        validator = create_validator(state, board_flipped, self.backend)
+        validator.track_kings()
 
         # --- Pre-computation ---
-        game_phase = _determine_game_phase(state)
         red_king_pos, black_king_pos = validator.find_kings()
         king_pos = {'red': red_king_pos, 'black': black_king_pos}
+        # Checkers and pins, shared by every mobility count below
+        if mobility == 'pseudo':
+            king_constraints = {'red': None, 'black': None}
+        else:
+            king_constraints = {'red': validator.king_constraints('red'), 'black': validator.king_constraints('black')}
 
         # --- Initialize Score Components ---
-        material_score = 0
-        pst_score = 0
         mobility_score = 0
         king_safety_score = 0
         structure_score = 0
 
+        # 1./2. Material (with river-crossing pawn bonus) and Piece-Square Table Score
+        red_material, red_pst = self._material_pst_scores([state])[0]
+        side_sign = 1 if ai_color == 'red' else -1
+        material_score = side_sign * red_material
+        pst_score = side_sign * red_pst
+
         # --- Iterate through board ---
         for r in range(10):
             for c in range(9):
                 piece = state[r][c]
                 if piece:
-                    piece_color_char = piece[0] # 'R' or 'B'
-                    piece_type = piece[1]       # '車', '馬', etc.
-                    piece_val = PIECE_VALUES[piece_type]
-                    current_piece_color = 'red' if piece_color_char == 'R' else 'black'
-
-                    # 1. Material Score
-                    base_material = piece_val
-                    # Pawn bonus for crossing river (value depends on phase)
-                    pawn_bonus = PAWN_ACROSS_RIVER_BONUS_MG + (PAWN_ACROSS_RIVER_BONUS_EG - PAWN_ACROSS_RIVER_BONUS_MG) * game_phase
-                    river_crossed = False
-                    if piece_type in ['兵', '卒']:
-                        if piece_color_char == 'R':
-                             river_crossed = (r < 5) if not board_flipped else (r > 4)
-                        else: # Black pawn
-                             river_crossed = (r > 4) if not board_flipped else (r < 5)
-                        if river_crossed:
-                            base_material += pawn_bonus
-
-                    if current_piece_color == ai_color:
-                        material_score += base_material
-                    else:
-                        material_score -= base_material
-
-                    # 2. Piece-Square Table Score
-                    pst_val = get_pst_score(piece_type, current_piece_color, r, c, board_flipped)
-                    if current_piece_color == ai_color:
-                        pst_score += pst_val
-                    else:
-                        pst_score -= pst_val
+                    current_piece_color = 'red' if piece[0] == 'R' else 'black'
 
                     # 3. Mobility Score (Calculated per piece)
                     # Note: This is the most expensive part.
-                    piece_mobility = _get_piece_mobility(validator, state, (r, c), current_piece_color)
+                    piece_mobility = _get_piece_mobility(validator, state, (r, c), current_piece_color,
+                                                         king_constraints[current_piece_color], mobility)
                     # Simple mobility: count moves
                     # Could add weighting here (e.g., bonus for moves attacking valuable pieces)
                     if current_piece_color == ai_color:
@@ -1386,6 +3346,266 @@ class MCTS:
         return int(total_score) # Return integer score
 
 
+def _mcts_worker(job):
+    """
+    Root-parallel worker: search a fresh tree, return playouts and
+    (code, visits, wins, AMAF visits, AMAF wins) for each root child
+    """
+    (state, color, flipped, seconds, seed, backend,
+     exploration_constant, rollout_policy, rollout_mobility, selection, rave) = job
+    random.seed(seed)
+    # Playouts never reach the mate or alpha-beta searches, so the tables are left minimal
+    mcts = MCTS(state, color, exploration_constant=exploration_constant, flipped=flipped, backend=backend,
+                mate_table=TranspositionTable(0), search_table=TranspositionTable(0))
+    mcts.rollout_policy = rollout_policy
+    mcts.rollout_mobility = rollout_mobility
+    mcts.selection = selection
+    mcts.rave = rave
+    playouts = mcts.run_playouts(seconds)
+    root = mcts.root
+    return playouts, list(zip((child.code for child in root.children), root.child_visits, root.child_wins,
+                              root.child_amaf_visits, root.child_amaf_wins))
+
+
+class AlphaBetaSearch(MCTS):
+    """
+    Principal-variation alpha-beta search with iterative deepening and
+    aspiration windows. Same constructor and get_best_move contract as MCTS
+    (whose evaluation it reuses for leaves), but time_limit is the whole
+    budget for the move: a new iteration is only started before
+    ALPHA_BETA_SOFT_TIME of it has passed, and a running one is abandoned
+    at the limit in favour of the last completed iteration's move.
+    """
+    def __init__(self, state, color, time_limit=1.0, exploration_constant=1.41, flipped=False, max_mate_depth=2,
+                 backend=None, mate_table=None, search_table=None, ordering=None):
+        super().__init__(state, color, time_limit, exploration_constant, flipped, max_mate_depth, backend,
+                         mate_table, search_table, ordering)
+        self.leaf_mobility = ROLLOUT_MOBILITY # Mobility counting for leaf evaluations
+        self.eval_cache = {}   # hash -> leaf score for the side to move
+        self.principal_variation = []
+
+    def get_best_move(self):
+        """Search deeper and deeper until the time manager stops, return the last completed best move"""
+        start_time = time.time()
+        self.deadline = start_time + self.time_limit
+        soft_deadline = start_time + self.time_limit * ALPHA_BETA_SOFT_TIME
+        self.nodes = 0
+        self.eval_cache.clear()
+        self.search_table.new_search()
+        self.ordering.new_search()
+
+        position = self._new_position(self.root_state, self.root.color)
+        moves = position.legal_moves()
+        if not moves:
+            return None
+        if len(moves) == 1:
+            return moves[0]
+
+        best_move = moves[0]
+        score = 0
+        for depth in range(1, ALPHA_BETA_MAX_DEPTH + 1):
+            try:
+                score, move = self._aspiration_search(position, moves, depth, score)
+            except TimeoutError:
+                break # Keep the previous iteration's move
+            best_move = move
+            # Search the best move first next iteration
+            moves.remove(move)
+            moves.insert(0, move)
+            self.principal_variation = self._principal_variation(position, depth)
+            print(f'depth {depth}: score {score} move {best_move} nodes {self.nodes} '
+                  f'time {time.time() - start_time:.2f}')
+            if abs(score) >= MATE_SCORE - ALPHA_BETA_MAX_DEPTH:
+                break # Forced mate found (or unavoidable), deeper search won't change it
+            if time.time() >= soft_deadline:
+                break
+
+        return best_move
+
+    def _aspiration_search(self, position, moves, depth, guess):
+        """Root search in a window around the previous score, widened on failure"""
+        if depth == 1:
+            return self._search_root(position, moves, depth, -MATE_SCORE - 1, MATE_SCORE + 1)
+        delta = ASPIRATION_WINDOW
+        alpha, beta = guess - delta, guess + delta
+        while True:
+            score, move = self._search_root(position, moves, depth, alpha, beta)
+            if score <= alpha:
+                delta *= 2
+                alpha = max(-MATE_SCORE - 1, guess - delta)
+            elif score >= beta:
+                delta *= 2
+                beta = min(MATE_SCORE + 1, guess + delta)
+            else:
+                return score, move
+
+    def _search_root(self, position, moves, depth, alpha, beta):
+        original_alpha = alpha
+        best_score = -MATE_SCORE - 1
+        best_move = moves[0]
+        for index, move in enumerate(moves):
+            token = position.make_move(move)
+            try:
+                if index == 0:
+                    score = -self._search(position, depth - 1, -beta, -alpha, 1, move)
+                else:
+                    score = -self._search(position, depth - 1, -alpha - 1, -alpha, 1, move)
+                    if alpha < score < beta:
+                        score = -self._search(position, depth - 1, -beta, -alpha, 1, move)
+            finally:
+                position.unmake_move(token)
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not token[2]:
+                    self.ordering.record_cutoff(move, depth, 0)
+                break
+        self._store(position.hash, depth, best_score, original_alpha, beta, best_move, 0)
+        return best_score, best_move
+
+    def _search(self, position, depth, alpha, beta, ply, previous=None):
+        """Negamax PVS returning the score for the side to move; previous is the move that led here"""
+        self.nodes += 1
+        if self.nodes & 15 == 0 and time.time() > self.deadline:
+            raise TimeoutError("Alpha-beta search timeout")
+
+        in_check = position.is_in_check()
+        if in_check and ply < ALPHA_BETA_MAX_DEPTH:
+            depth += 1 # Check extension
+        if depth <= 0:
+            return self.quiescence(position, alpha, beta, ply)
+
+        tt_move = None
+        entry = self.search_table.probe(position.hash)
+        if entry:
+            entry_depth, flag, score, tt_move = entry
+            if entry_depth >= depth:
+                score = _score_from_table(score, ply)
+                if flag == TT_EXACT or (flag == TT_LOWER and score >= beta) or (flag == TT_UPPER and score <= alpha):
+                    return score
+
+        moves = position.legal_moves()
+        if not moves:
+            return -MATE_SCORE + ply # No legal move loses, in check or not
+
+        original_alpha = alpha
+        best_score = -MATE_SCORE - 1
+        best_move = None
+        for index, move in enumerate(self._order_moves(position, moves, tt_move, ply, previous)):
+            token = position.make_move(move)
+            try:
+                if index == 0:
+                    score = -self._search(position, depth - 1, -beta, -alpha, ply + 1, move)
+                else:
+                    score = -self._search(position, depth - 1, -alpha - 1, -alpha, ply + 1, move)
+                    if alpha < score < beta:
+                        score = -self._search(position, depth - 1, -beta, -alpha, ply + 1, move)
+            finally:
+                position.unmake_move(token)
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not token[2]:
+                    self.ordering.record_cutoff(move, depth, ply, previous)
+                break
+
+        self._store(position.hash, depth, best_score, original_alpha, beta, best_move, ply)
+        return best_score
+
+    def _store(self, key, depth, score, alpha, beta, best_move, ply):
+        if score <= alpha:
+            flag = TT_UPPER
+        elif score >= beta:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        self.search_table.store(key, depth, flag, _score_to_table(score, ply), best_move)
+
+    def _leaf_score(self, position):
+        """MCTS._leaf_score with leaf_mobility, cached by hash for the current search"""
+        score = self.eval_cache.get(position.hash)
+        if score is None:
+            score = self._evaluate_position(position.board, position.color, self.leaf_mobility)
+            self.eval_cache[position.hash] = score
+        return score
+
+    def _order_moves(self, position, moves, tt_move, ply=None, previous=None):
+        """
+        Table move first, then captures that don't lose material (most valuable
+        victim / least valuable attacker), quiet moves (killers, countermove,
+        then history, see MoveOrdering), and losing captures last.
+        """
+        board = position.board
+        validator = position.validator
+        ordering = self.ordering
+        def order_key(move):
+            if move == tt_move:
+                return 0, 0
+            if not board[move[1][0]][move[1][1]]:
+                return 2, -ordering.quiet_score(move, ply, previous)
+            exchange = validator.static_exchange(*move)
+            if exchange < 0:
+                return 3, -exchange
+            return 1, -_mvv_lva_score(board, move)
+        return sorted(moves, key=order_key)
+
+    def _principal_variation(self, position, depth):
+        """Follow table moves from the root to recover the expected line"""
+        line = []
+        tokens = []
+        seen = set()
+        while len(line) < depth and position.hash not in seen:
+            seen.add(position.hash)
+            entry = self.search_table.probe(position.hash)
+            if not entry or entry[3] is None or entry[3] not in position.legal_moves():
+                break
+            line.append(entry[3])
+            tokens.append(position.make_move(entry[3]))
+        for token in reversed(tokens):
+            position.unmake_move(token)
+        return line
+
+
+def _mvv_lva_score(board, move):
+    """Capture ordering score: most valuable victim first, least valuable attacker breaking ties; 0 for quiet moves"""
+    (from_row, from_col), (to_row, to_col) = move
+    captured = board[to_row][to_col]
+    if not captured:
+        return 0
+    return PIECE_VALUES[captured[1]] * 16 - PIECE_VALUES[board[from_row][from_col][1]] // 100
+
+def _material_balance(position, color):
+    """Material of color minus the opponent's, generals excluded"""
+    return position.material[color] - position.material['black' if color == 'red' else 'red']
+
+def _score_to_table(score, ply):
+    """Store mate scores relative to the node so they stay valid at other plies"""
+    if score >= MATE_SCORE - ALPHA_BETA_MAX_DEPTH * 2:
+        return score + ply
+    if score <= -MATE_SCORE + ALPHA_BETA_MAX_DEPTH * 2:
+        return score - ply
+    return score
+
+def _score_from_table(score, ply):
+    if score >= MATE_SCORE - ALPHA_BETA_MAX_DEPTH * 2:
+        return score - ply
+    if score <= -MATE_SCORE + ALPHA_BETA_MAX_DEPTH * 2:
+        return score + ply
+    return score
+
+
+# Engines ChineseChess.make_ai_move can play with, by name
+AI_ENGINES = {
+    'mcts': MCTS,
+    'alphabeta': AlphaBetaSearch,
+}
+AI_ENGINE = 'mcts' # Default engine for new games
+
+
 class ChineseChess:
 
     def __init__(self):
@@ -1395,6 +3615,13 @@ class ChineseChess:
         self.timer_running = False
         self.timer_value = 0
         self.timer_after_id = None
+
+        self.ai_engine = AI_ENGINE # Key into AI_ENGINES used by make_ai_move
+        # Search tables kept across the AI's moves in a game
+        self.mate_table = TranspositionTable(MATE_TABLE_MB)
+        self.search_table = TranspositionTable(TRANSPOSITION_TABLE_MB)
+        self.move_ordering = MoveOrdering()
+        self.engine = None # Engine kept between AI moves, see make_ai_move
         
            
         self.piece_setting_mode = False
@@ -2119,11 +4346,19 @@ class ChineseChess:
             row, col = self.selected_piece
             rotate_piece = (9 - row, 8 - col)
         
+    def reset_ai_state(self):
+        """Drop the engine and search tables kept across the AI's moves, for a new game or orientation"""
+        self.mate_table.clear()
+        self.search_table.clear()
+        self.move_ordering.clear()
+        self.engine = None
+
     def start_new_game(self):
         
         self.stop_timer()  # Stop timer when AI starts its move
         self.timer_label.config(text='000')
         self.disable_history_menu()
+        self.reset_ai_state()
 
         self.check_rotate = False
         self.rotate_board = [[None for _ in range(9)] for _ in range(10)]
@@ -2770,7 +5005,7 @@ class ChineseChess:
 
 
     def make_ai_move(self):
-        """Make an AI move using MCTS"""
+        """Make an AI move using the engine selected by self.ai_engine"""
         self.start_timer()  # Start timer after human move
         
         self.rotate_board = [[None for _ in range(9)] for _ in range(10)]
@@ -2810,8 +5045,17 @@ class ChineseChess:
                     self.enable_history_menu()
                 return
             
-            # Create MCTS instance with reference to the game
-            mcts = MCTS(self.board, ai_color, time_limit=30.0, flipped=self.flipped, max_mate_depth=30)
+            # Keep using the selected engine (MCTS by default) so its tree from the
+            # previous move carries over, or create it with reference to the game
+            engine_class = AI_ENGINES[self.ai_engine]
+            mcts = self.engine
+            if mcts is not None and type(mcts) is engine_class and mcts.root.flipped == self.flipped:
+                mcts.advance(self.board, ai_color)
+            else:
+                mcts = engine_class(self.board, ai_color, time_limit=30.0, flipped=self.flipped, max_mate_depth=30,
+                                    mate_table=self.mate_table, search_table=self.search_table,
+                                    ordering=self.move_ordering)
+                self.engine = mcts
             best_move = mcts.get_best_move()
 
             if best_move:
@@ -2863,29 +5107,19 @@ class ChineseChess:
             '卒': 100, '兵': 100
         }
         
-        # Check if the piece is under attack
-        is_attacked = False
-        defenders = 0
-        attackers = 0
-        
-        # Count attackers and defenders
-        for r in range(10):
-            for c in range(9):
-                checking_piece = self.board[r][c]
-                if checking_piece:
-                    if checking_piece[0] != color[0].upper():  # Enemy piece
-                        # If enemy can capture this piece
-                        if self.is_valid_move((r, c), (row, col)):
-                            attackers += 1
-                            is_attacked = True
-                            # Penalty based on value difference
-                            if piece_values[checking_piece[1]] < piece_values[piece[1]]:
-                                safety_score -= 50  # Extra penalty if threatened by lesser piece
-                    else:  # Friendly piece
-                        if self.is_valid_move((r, c), (row, col)):
-                            defenders += 1
-                            safety_score += 20  # Bonus for each defender
-        
+        # Count attackers and defenders from the square outward
+        validator = ChessValidator(self.board, self.flipped)
+        enemy_color = 'black' if color == 'red' else 'red'
+        attacker_squares = validator.attackers_of((row, col), enemy_color)
+        attackers = len(attacker_squares)
+        defenders = len(validator.attackers_of((row, col), color))
+        is_attacked = attackers > 0
+        for r, c in attacker_squares:
+            # Penalty based on value difference
+            if piece_values[self.board[r][c][1]] < piece_values[piece[1]]:
+                safety_score -= 50  # Extra penalty if threatened by lesser piece
+        safety_score += 20 * defenders  # Bonus for each defender
+
         # Heavy penalty if attacked and not defended
         if is_attacked and defenders == 0:
             safety_score -= 200
@@ -2923,16 +5157,9 @@ class ChineseChess:
 
     def get_all_valid_moves(self, color):
         """Get all valid moves for a given color"""
-        moves = []
-        for from_row in range(10):
-            for from_col in range(9):
-                piece = self.board[from_row][from_col]
-                if piece and piece[0] == color[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            if self.is_valid_move((from_row, from_col), (to_row, to_col)):
-                                moves.append(((from_row, from_col), (to_row, to_col)))
-        return moves
+        # The GUI's general move rule does not test facing generals, so neither does this
+        validator = ChessValidator(self.board, self.flipped)
+        return list(validator.generate_pseudo_legal_moves(color, flying_general=False))
 
     def is_checkmate(self, color):
         """
@@ -2941,30 +5168,11 @@ class ChineseChess:
         """
         
         
-        # Try every possible move for every piece of the current player
-        for row in range(10):
-            for col in range(9):
-                piece = self.board[row][col]
-                if piece and piece[0] == color[0].upper():  # If it's current player's piece
-                    # Try all possible destinations
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            if self.is_valid_move((row, col), (to_row, to_col)):
-                                # Try the move
-                                original_piece = self.board[to_row][to_col]
-                                self.board[to_row][to_col] = piece
-                                self.board[row][col] = None
-                                
-                                # Check if still in check
-                                still_in_check = self.is_in_check(color)
-                                
-                                # Undo the move
-                                self.board[row][col] = piece
-                                self.board[to_row][to_col] = original_piece
-                                
-                                # If any move gets out of check, not checkmate
-                                if not still_in_check:
-                                    return False
+        # Look for any legal move, using the pin/check-aware generator
+        validator = ChessValidator(self.board, self.flipped)
+        validator.track_kings()
+        for move in validator.iter_legal_moves(color):
+            return False # A move gets out of check, not checkmate
         
         # If no legal moves found, it's checkmate
             
@@ -2976,6 +5184,8 @@ class ChineseChess:
         """Switch the board orientation by rotating it 180 degrees"""
         
         self.flipped = not self.flipped
+        # Stored results assumed the old orientation's pawn and palace rules
+        self.reset_ai_state()
 
         self.top_numbers = self.black_numbers if not self.flipped else self.red_numbers_flipped
         self.bottom_numbers = self.red_numbers if not self.flipped else self.black_numbers_flipped
@@ -3884,6 +6094,7 @@ class ChineseChess:
         self.stop_timer()  # Stop timer when AI starts its move
         self.timer_label.config(text='000')
         self.disable_history_menu()
+        self.reset_ai_state()
 
         self.check_rotate = False
         self.rotate_board = [[None for _ in range(9)] for _ in range(10)]
@@ -0,0 +1,41 @@
+import importlib.util
+import os
+import time
+
+import pytest
+
+pytest.importorskip("tkinter")
+pytest.importorskip("pygame")
+
+GAME_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "7.3.63.py")
+
+
+def load_game():
+    spec = importlib.util.spec_from_file_location("xiangqi_game", GAME_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def board_from(pieces):
+    board = [[None] * 9 for _ in range(10)]
+    for row, col, piece in pieces:
+        board[row][col] = piece
+    return board
+
+
+# Red mates in two: cannon to (5, 5), then the horse to (4, 5)
+MATE_IN_TWO = [(1, 5, 'B將'), (5, 6, 'R炮'), (5, 7, 'R馬'), (7, 4, 'R帥'), (8, 7, 'B卒')]
+
+
+def test_repeated_mate_search_returns_full_line():
+    game = load_game()
+    board = board_from(MATE_IN_TWO)
+    engine = game.MCTS(board, 'red', mate_table=game.TranspositionTable(1))
+
+    first = engine.find_mate_in_n(board, 'red', 2, time.time(), 60)
+    assert first is not None and len(first) == 2
+
+    # The table now proves the mate, the line must still come back whole
+    assert engine.find_mate_in_n(board, 'red', 3, time.time(), 60) == first
+    assert engine.find_mate_in_n(board, 'red', 2, time.time(), 60) == first